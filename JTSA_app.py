@@ -1,7 +1,30 @@
+import time
+
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import numpy as np
+
+from jtsa_data import (
+    FIGURE_CACHE,
+    RENDER_PROFILER,
+    RerunProfile,
+    TEXT_COL,
+    TOP_VALUE,
+    cache_stats,
+    canonical_filters,
+    cube_crosstab,
+    data_version,
+    export_file,
+    filter_index,
+    filtered_rows,
+    funnel_steps,
+    load_data,
+    load_multi_choice,
+    load_segment_cube,
+    load_text_index,
+    page_window,
+    profiling_enabled,
+)
 
 # -----------------------------------------------------------
 # 1. Page config
@@ -56,119 +79,13 @@ def get_axis_label(col: str) -> str:
 # 3. Data loading & preparation
 # -----------------------------------------------------------
 
-#@st.cache_data(ttl=3 * 24 * 3600)  # 3 days
-def load_data(path: str = "data_processed/df_clean.csv") -> pd.DataFrame: 
-    df = pd.read_csv(path)
-
-    # -------------------------------------------------------
-    # 1) Map Likert scale to numeric for interest columns
-    # -------------------------------------------------------
-    interest_cols = [
-        "rating_interest_culture_and_history",
-        "rating_interest_food",
-        "rating_interest_nature_hiking",
-        "rating_interest_shopping_and_techno",
-        "rating_interest_events_and_festivals",
-        "rating_interest_wellness",
-        "rating_interest_theme_park",
-    ]
-
-    likert_mapping = {
-        "Not important at all": 1,
-        "Slightly important": 2,
-        "Moderately important": 3,
-        "Very important": 4,
-        "Essential": 5,
-    }
-
-    for col in interest_cols:
-        if col in df.columns:
-            df[col] = df[col].replace(likert_mapping)
-            df[col] = df[col].replace(["0", 0], np.nan)
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    # -------------------------------------------------------
-    # 2) Compute interest scores
-    # -------------------------------------------------------
-    df["overall_interest_score"] = df[interest_cols].mean(axis=1)
-
-    df["interest_culture_food"] = df[
-        ["rating_interest_culture_and_history", "rating_interest_food"]
-    ].mean(axis=1)
-
-    df["interest_nature_wellness"] = df[
-        ["rating_interest_nature_hiking", "rating_interest_wellness"]
-    ].mean(axis=1)
-
-    df["interest_urban_entertainment"] = df[
-        [
-            "rating_interest_shopping_and_techno",
-            "rating_interest_events_and_festivals",
-            "rating_interest_theme_park",
-        ]
-    ].mean(axis=1)
-
-    # -------------------------------------------------------
-    # 3) Category orders
-    # -------------------------------------------------------
-    CATEGORY_ORDERS = {
-        "age_group": ["18-24", "25-34", "35-44", "45-54", "55-64", "65 and over"],
-        "household_income_in_€": [
-            "1500 and less",
-            "1500-1999",
-            "2000-2499",
-            "2500-2999",
-            "3000-3999",
-            "4000–4999",
-            "5000–5999",
-            "6000–6999",
-            "7000 and more",
-            "Unknown",
-        ],
-        "travel_frequency": [
-            "Several times a year",
-            "Once a year",
-            "Every 2–3 years",
-            "Once every 5 years or more",
-            "Never",
-        ],
-        "Japan_vac_duration": [
-            "1 week",
-            "2 weeks",
-            "3 weeks",
-            "4 weeks",
-            "More than 4 weeks",
-            "I don’t know yet / Not sure",
-        ],
-        "Japan_budget_per_week": [
-            "Less than 500",
-            "500-1000",
-            "1000-1500",
-            "1500-2500",
-            "More than 2500",
-            "Unknown",
-        ],
-        "alt_dest_budget_per_week": [
-            "Less than 500",
-            "500-1000",
-            "1000-1500",
-            "1500-2500",
-            "More than 2500",
-        ],
-        "been_to_Japan": [
-            "No, and I’m not interested",
-            "No, but I would like to go",
-            "Yes, once",
-            "Yes, several times",
-        ],
-    }
-
-    df.attrs["category_orders"] = CATEGORY_ORDERS
-
-    return df
-
+# Opt-in profiling panel (see section 7): ?profile=1 or JTSA_PROFILE=1
+profiling = profiling_enabled(st.query_params.get("profile"))
+rerun = RerunProfile()
 
 df = load_data()
+df_multi = load_multi_choice()
+rerun.lap("load_data")
 
 
 def get_category_orders() -> dict:
@@ -181,19 +98,25 @@ CATEGORY_ORDERS = get_category_orders()
 # 4. Helper functions
 # -----------------------------------------------------------
 
-def apply_sidebar_filters(df_source: pd.DataFrame) -> pd.DataFrame:
-    """Create sidebar filters and return the filtered dataframe."""
+def apply_sidebar_filters(df_source: pd.DataFrame):
+    """Create sidebar filters and return the filtered dataframe and the selections.
+
+    Selections are resolved on the dataset's bitmap index; the filtered rows are
+    shared by every session with the same selections (see filtered_rows), and
+    df_source itself is returned when nothing is selected.
+    """
+    index = filter_index(df_source)
     st.sidebar.header("Filters")
 
     # Nationality
-    nationalities = sorted(df_source["nationality"].dropna().unique().tolist())
+    nationalities = sorted(index.values("nationality"))
     selected_nationalities = st.sidebar.multiselect(
         "Filter by nationality",
         options=nationalities,
     )
 
     # Country of residence
-    countries = sorted(df_source["country"].dropna().unique().tolist())
+    countries = sorted(index.values("country"))
     selected_countries = st.sidebar.multiselect(
         "Filter by country of residence",
         options=countries,
@@ -201,7 +124,7 @@ def apply_sidebar_filters(df_source: pd.DataFrame) -> pd.DataFrame:
 
     # Age group
     age_order = CATEGORY_ORDERS.get("age_group")
-    age_values = df_source["age_group"].dropna().unique().tolist()
+    age_values = index.values("age_group")
     if age_order:
         age_values = [a for a in age_order if a in age_values]
     else:
@@ -214,7 +137,7 @@ def apply_sidebar_filters(df_source: pd.DataFrame) -> pd.DataFrame:
 
     # Income
     income_order = CATEGORY_ORDERS.get("household_income_in_€")
-    income_values = df_source["household_income_in_€"].dropna().unique().tolist()
+    income_values = index.values("household_income_in_€")
     if income_order:
         income_values = [i for i in income_order if i in income_values]
     else:
@@ -227,7 +150,7 @@ def apply_sidebar_filters(df_source: pd.DataFrame) -> pd.DataFrame:
 
     # Been to Japan
     been_order = CATEGORY_ORDERS.get("been_to_Japan")
-    been_values = df_source["been_to_Japan"].dropna().unique().tolist()
+    been_values = index.values("been_to_Japan")
     if been_order:
         been_values = [b for b in been_order if b in been_values]
     else:
@@ -240,7 +163,7 @@ def apply_sidebar_filters(df_source: pd.DataFrame) -> pd.DataFrame:
 
     # Travel frequency
     freq_order = CATEGORY_ORDERS.get("travel_frequency")
-    freq_values = df_source["travel_frequency"].dropna().unique().tolist()
+    freq_values = index.values("travel_frequency")
     if freq_order:
         freq_values = [f for f in freq_order if f in freq_values]
     else:
@@ -252,21 +175,43 @@ def apply_sidebar_filters(df_source: pd.DataFrame) -> pd.DataFrame:
     )
 
     # Apply filters
-    df_filtered = df_source.copy()
-    if selected_nationalities:
-        df_filtered = df_filtered[df_filtered["nationality"].isin(selected_nationalities)]
-    if selected_countries:
-        df_filtered = df_filtered[df_filtered["country"].isin(selected_countries)]
-    if selected_age:
-        df_filtered = df_filtered[df_filtered["age_group"].isin(selected_age)]
-    if selected_income:
-        df_filtered = df_filtered[df_filtered["household_income_in_€"].isin(selected_income)]
-    if selected_been:
-        df_filtered = df_filtered[df_filtered["been_to_Japan"].isin(selected_been)]
-    if selected_freq:
-        df_filtered = df_filtered[df_filtered["travel_frequency"].isin(selected_freq)]
-
-    return df_filtered
+    selections = {
+        "nationality": selected_nationalities,
+        "country": selected_countries,
+        "age_group": selected_age,
+        "household_income_in_€": selected_income,
+        "been_to_Japan": selected_been,
+        "travel_frequency": selected_freq,
+    }
+    return filtered_rows(df_source, selections), selections
+
+
+def show_figure(name: str, build, *params):
+    """Render the figure returned by build(), reusing it across reruns.
+
+    Figures are cached per (dataset version, sidebar filters, name, params), so
+    build must only depend on df_filtered and on params.
+    """
+    key = (data_version(df), canonical_filters(filter_selections), name) + params
+    build_seconds = []
+
+    def timed_build():
+        start = time.perf_counter()
+        fig = build()
+        build_seconds.append(time.perf_counter() - start)
+        return fig
+
+    fig = FIGURE_CACHE.get_or_build(key, timed_build)
+    if fig is not None:
+        render_figure(fig, name, sum(build_seconds), cached=not build_seconds)
+    return fig
+
+
+def render_figure(fig, name: str, build_seconds: float = 0.0, cached: bool = False):
+    """Send fig to the browser and record its timings for the profiling panel."""
+    start = time.perf_counter()
+    st.plotly_chart(fig, use_container_width=True)
+    rerun.figure(name, build_seconds, time.perf_counter() - start, cached, fig if profiling else None)
 
 
 def plot_bar_count(
@@ -277,57 +222,60 @@ def plot_bar_count(
     normalize: bool = False,
     x_label: str = None,
 ):
-    """Generic bar chart for counts or percentages."""
+    """Generic bar chart for counts or percentages (df_source is the filtered dataset)."""
     if order is None:
         order = CATEGORY_ORDERS.get(col)
 
-    vc = df_source[col].value_counts(dropna=False).rename_axis(col).reset_index(name="count")
-
-    if normalize:
-        total = vc["count"].sum()
-        vc["pct"] = (vc["count"] / total * 100).round(1)
-        y_col = "pct"
-        y_label = "Percentage"
-        text_col = "pct"
-    else:
-        y_col = "count"
-        y_label = "Count"
-        text_col = "count"
-
-    if order:
-        vc[col] = pd.Categorical(vc[col], categories=order, ordered=True)
-        vc = vc.sort_values(col)
+    def build():
+        vc = df_source[col].value_counts(dropna=False).rename_axis(col).reset_index(name="count")
+        vc = vc[vc["count"] > 0]  # categorical columns also report unused answers
 
-    fig = px.bar(
-        vc,
-        x=col,
-        y=y_col,
-        text=text_col,
-        title=title,
-    )
+        if normalize:
+            total = vc["count"].sum()
+            vc["pct"] = (vc["count"] / total * 100).round(1)
+            y_col = "pct"
+            y_label = "Percentage"
+            text_col = "pct"
+        else:
+            y_col = "count"
+            y_label = "Count"
+            text_col = "count"
+
+        if order:
+            vc[col] = pd.Categorical(vc[col], categories=order, ordered=True)
+            vc = vc.sort_values(col)
+
+        fig = px.bar(
+            vc,
+            x=col,
+            y=y_col,
+            text=text_col,
+            title=title,
+        )
 
-    # X-axis label
-    if x_label is not None:
-        fig.update_layout(xaxis_title=x_label)
-    else:
-        fig.update_layout(xaxis_title=get_axis_label(col))
+        # X-axis label
+        if x_label is not None:
+            fig.update_layout(xaxis_title=x_label)
+        else:
+            fig.update_layout(xaxis_title=get_axis_label(col))
 
-    # Y-axis label
-    fig.update_layout(yaxis_title=y_label)
-    fig.update_traces(textposition="outside")
+        # Y-axis label
+        fig.update_layout(yaxis_title=y_label)
+        fig.update_traces(textposition="outside")
+        return fig
 
-    st.plotly_chart(fig, use_container_width=True)
+    show_figure("bar_count", build, col, title, tuple(order or ()), normalize, x_label)
 
 
-def melt_multi_columns(df_source: pd.DataFrame, prefix: str, value_name: str) -> pd.DataFrame:
-    """Melt columns with a common prefix into a long format."""
-    cols = [c for c in df_source.columns if c.startswith(prefix)]
-    melted = df_source.melt(
-        value_vars=cols,
-        value_name=value_name,
-        var_name="rank",
-    ).dropna(subset=[value_name])
-    return melted
+def multi_choice_answers(df_source: pd.DataFrame, question: str, value_name: str) -> pd.DataFrame:
+    """Answers to a multi-choice question from the respondents of df_source, one row per answer."""
+    answers = df_multi[
+        (df_multi["question"] == question)
+        & df_multi["respondent_id"].isin(df_source["respondent_id"])
+    ]
+    answers = answers[["respondent_id", "rank", "value"]].rename(columns={"value": value_name})
+    answers[value_name] = answers[value_name].cat.remove_unused_categories()
+    return answers
 
 
 # -----------------------------------------------------------
@@ -349,7 +297,8 @@ page = st.sidebar.selectbox(
 )
 
 # Apply filters once for all pages
-df_filtered = apply_sidebar_filters(df)
+df_filtered, filter_selections = apply_sidebar_filters(df)
+rerun.lap("filters")
 
 normalize_global = st.sidebar.checkbox(
     "Show percentages instead of counts",
@@ -376,6 +325,7 @@ st.sidebar.markdown(
     "[✉️ Contact Me](https://linktr.ee/jb_contactme) ",
     unsafe_allow_html=True
 )
+rerun.lap("sidebar")
 
 
 # -----------------------------------------------------------
@@ -455,29 +405,32 @@ if page == "Overview":
         "rating_interest_theme_park",
     ]
 
-    interest_long = (
-        df_filtered[interest_cols]
-        .mean()
-        .reset_index()
-        .rename(columns={"index": "dimension", 0: "avg_score"})
-    )
-    interest_long["dimension"] = interest_long["dimension"].str.replace(
-        "rating_interest_", "", regex=False
-    )
+    def build_interest():
+        interest_long = (
+            df_filtered[interest_cols]
+            .mean()
+            .reset_index()
+            .rename(columns={"index": "dimension", 0: "avg_score"})
+        )
+        interest_long["dimension"] = interest_long["dimension"].str.replace(
+            "rating_interest_", "", regex=False
+        )
 
-    fig_interest = px.bar(
-        interest_long,
-        x="dimension",
-        y="avg_score",
-        title="Average interest score by dimension",
-        text="avg_score",
-    )
-    fig_interest.update_layout(
-        xaxis_title="",
-        yaxis_title="Average score (1–5)",
-    )
-    fig_interest.update_traces(texttemplate="%{text:.2f}", textposition="outside")
-    st.plotly_chart(fig_interest, use_container_width=True)
+        fig_interest = px.bar(
+            interest_long,
+            x="dimension",
+            y="avg_score",
+            title="Average interest score by dimension",
+            text="avg_score",
+        )
+        fig_interest.update_layout(
+            xaxis_title="",
+            yaxis_title="Average score (1–5)",
+        )
+        fig_interest.update_traces(texttemplate="%{text:.2f}", textposition="outside")
+        return fig_interest
+
+    show_figure("interest_by_dimension", build_interest)
 
     st.markdown("### Trip expectations (duration & budget)")
 
@@ -560,15 +513,18 @@ elif page == "Segments & Cross-Analysis":
 
 
 
-    ctab = (
-        df_filtered.groupby([group_col, target_col])
-        .size()
-        .reset_index(name="count")
-    )
+    # Unfiltered counts come from the pre-aggregated cube, filtered ones from the filtered rows
+    ctab = cube_crosstab(load_segment_cube(), df, group_col, target_col, filter_selections)
+    if ctab is None:
+        ctab = (
+            df_filtered.groupby([group_col, target_col], observed=True)
+            .size()
+            .reset_index(name="count")
+        )
 
     normalize = normalize_global
     if normalize:
-        total_per_group = ctab.groupby(group_col)["count"].transform("sum")
+        total_per_group = ctab.groupby(group_col, observed=True)["count"].transform("sum")
         ctab["pct"] = ctab["count"] / total_per_group * 100
         y_col = "pct"
         y_label = "Percentage"
@@ -599,13 +555,13 @@ elif page == "Segments & Cross-Analysis":
         xaxis_title=get_axis_label(group_col),
         yaxis_title=y_label,
     )
-    st.plotly_chart(fig_seg, use_container_width=True)
+    render_figure(fig_seg, "segment_distribution")
 
     st.markdown("---")
     st.markdown("### Average interest score by segment")
 
     seg_interest = (
-        df_filtered.groupby(group_col)["overall_interest_score"]
+        df_filtered.groupby(group_col, observed=True)["overall_interest_score"]
         .mean()
         .reset_index()
         .rename(columns={"overall_interest_score": "avg_interest"})
@@ -629,7 +585,7 @@ elif page == "Segments & Cross-Analysis":
         xaxis_title=get_axis_label(group_col),
         yaxis_title="Average interest (1–5)",
     )
-    st.plotly_chart(fig_int_seg, use_container_width=True)
+    render_figure(fig_int_seg, "interest_by_segment")
 
 # ---------------- Difficulties & Barriers -------------------
 elif page == "Difficulties & Barriers":
@@ -637,52 +593,59 @@ elif page == "Difficulties & Barriers":
 
     st.markdown("This page focuses on difficulties for Japan vs alternative destinations.")
 
-    japan_diffs = melt_multi_columns(df_filtered, "Japan_most_difficulties_", "difficulty_japan")
-    alt_diffs = melt_multi_columns(df_filtered, "alt_dest_most_difficulties_", "difficulty_alt")
+    def build_japan_diff():
+        japan_diffs = multi_choice_answers(df_filtered, "Japan_most_difficulties", "difficulty_japan")
 
-    # Aggregate for Japan
-    japan_counts = (
-        japan_diffs["difficulty_japan"]
-        .value_counts()
-        .reset_index()
-    )
-    japan_counts.columns = ["difficulty", "count"]
-
-    fig_japan_diff = px.bar(
-        japan_counts,
-        x="difficulty",
-        y="count",
-        title="Main difficulties when planning a trip to Japan",
-        text="count",
-    )
-    fig_japan_diff.update_traces(textposition="outside")
-    fig_japan_diff.update_layout(
-        xaxis_title="Difficulty",
-        yaxis_title="Count",
-    )
-    st.plotly_chart(fig_japan_diff, use_container_width=True)
+        # Aggregate for Japan
+        japan_counts = (
+            japan_diffs["difficulty_japan"]
+            .value_counts()
+            .reset_index()
+        )
+        japan_counts.columns = ["difficulty", "count"]
 
-    # Aggregate for alternative destinations
-    alt_counts = (
-        alt_diffs["difficulty_alt"]
-        .value_counts()
-        .reset_index()
-    )
-    alt_counts.columns = ["difficulty", "count"]
-
-    fig_alt_diff = px.bar(
-        alt_counts,
-        x="difficulty",
-        y="count",
-        title="Main difficulties for alternative destinations",
-        text="count",
-    )
-    fig_alt_diff.update_traces(textposition="outside")
-    fig_alt_diff.update_layout(
-        xaxis_title="Difficulty",
-        yaxis_title="Count",
-    )
-    st.plotly_chart(fig_alt_diff, use_container_width=True)
+        fig_japan_diff = px.bar(
+            japan_counts,
+            x="difficulty",
+            y="count",
+            title="Main difficulties when planning a trip to Japan",
+            text="count",
+        )
+        fig_japan_diff.update_traces(textposition="outside")
+        fig_japan_diff.update_layout(
+            xaxis_title="Difficulty",
+            yaxis_title="Count",
+        )
+        return fig_japan_diff
+
+    show_figure("japan_difficulties", build_japan_diff)
+
+    def build_alt_diff():
+        alt_diffs = multi_choice_answers(df_filtered, "alt_dest_most_difficulties", "difficulty_alt")
+
+        # Aggregate for alternative destinations
+        alt_counts = (
+            alt_diffs["difficulty_alt"]
+            .value_counts()
+            .reset_index()
+        )
+        alt_counts.columns = ["difficulty", "count"]
+
+        fig_alt_diff = px.bar(
+            alt_counts,
+            x="difficulty",
+            y="count",
+            title="Main difficulties for alternative destinations",
+            text="count",
+        )
+        fig_alt_diff.update_traces(textposition="outside")
+        fig_alt_diff.update_layout(
+            xaxis_title="Difficulty",
+            yaxis_title="Count",
+        )
+        return fig_alt_diff
+
+    show_figure("alt_dest_difficulties", build_alt_diff)
 
     st.markdown("---")
     st.markdown("### Difficulties by segment")
@@ -693,40 +656,44 @@ elif page == "Difficulties & Barriers":
         index=0,
     )
 
-    japan_diffs_with_seg = japan_diffs.join(
-        df_filtered[[diff_group_col]].reset_index(drop=True)
-    )
+    def build_diff_by_seg():
+        japan_diffs = multi_choice_answers(df_filtered, "Japan_most_difficulties", "difficulty_japan")
+        japan_diffs_with_seg = japan_diffs.merge(
+            df_filtered[["respondent_id", diff_group_col]], on="respondent_id"
+        )
 
-    diff_by_seg = (
-        japan_diffs_with_seg.groupby([diff_group_col, "difficulty_japan"])
-        .size()
-        .reset_index(name="count")
-    )
+        diff_by_seg = (
+            japan_diffs_with_seg.groupby([diff_group_col, "difficulty_japan"], observed=True)
+            .size()
+            .reset_index(name="count")
+        )
 
-    total_per_seg = diff_by_seg.groupby(diff_group_col)["count"].transform("sum")
-    diff_by_seg["pct"] = diff_by_seg["count"] / total_per_seg * 100
+        total_per_seg = diff_by_seg.groupby(diff_group_col, observed=True)["count"].transform("sum")
+        diff_by_seg["pct"] = diff_by_seg["count"] / total_per_seg * 100
 
-    seg_order = CATEGORY_ORDERS.get(diff_group_col)
-    if seg_order:
-        diff_by_seg[diff_group_col] = pd.Categorical(
-            diff_by_seg[diff_group_col], categories=seg_order, ordered=True
+        seg_order = CATEGORY_ORDERS.get(diff_group_col)
+        if seg_order:
+            diff_by_seg[diff_group_col] = pd.Categorical(
+                diff_by_seg[diff_group_col], categories=seg_order, ordered=True
+            )
+            diff_by_seg = diff_by_seg.sort_values(diff_group_col)
+
+        fig_diff_seg = px.bar(
+            diff_by_seg,
+            x=diff_group_col,
+            y="pct",
+            color="difficulty_japan",
+            title=f"Difficulties for Japan by {diff_group_col}",
+            text="pct",
         )
-        diff_by_seg = diff_by_seg.sort_values(diff_group_col)
-
-    fig_diff_seg = px.bar(
-        diff_by_seg,
-        x=diff_group_col,
-        y="pct",
-        color="difficulty_japan",
-        title=f"Difficulties for Japan by {diff_group_col}",
-        text="pct",
-    )
-    fig_diff_seg.update_traces(texttemplate="%{text:.1f}%", textposition="inside")
-    fig_diff_seg.update_layout(
-        xaxis_title=get_axis_label(diff_group_col),
-        yaxis_title="Percentage",
-    )
-    st.plotly_chart(fig_diff_seg, use_container_width=True)
+        fig_diff_seg.update_traces(texttemplate="%{text:.1f}%", textposition="inside")
+        fig_diff_seg.update_layout(
+            xaxis_title=get_axis_label(diff_group_col),
+            yaxis_title="Percentage",
+        )
+        return fig_diff_seg
+
+    show_figure("difficulties_by_segment", build_diff_by_seg, diff_group_col)
 
 # ------------------ Prefecture Wishlist ---------------------
 elif page == "Prefecture Wishlist":
@@ -736,31 +703,21 @@ elif page == "Prefecture Wishlist":
         "Ranking of Japanese prefectures based on weighted preferences "
     )
 
-    rank_weights = {
-        "most_wanted_pref_to_visit_1": 1,
-        "most_wanted_pref_to_visit_2": 1,
-        "most_wanted_pref_to_visit_3": 1,
-        "most_wanted_pref_to_visit_4": 1,
-        "most_wanted_pref_to_visit_5": 1,
-    }
-
-    pref_scores_list = []
-    for col, weight in rank_weights.items():
-        if col in df_filtered.columns:
-            tmp = df_filtered[[col]].rename(columns={col: "prefecture"}).dropna()
-            tmp["score"] = weight
-            pref_scores_list.append(tmp)
-
-    if pref_scores_list:
-        pref_scores = pd.concat(pref_scores_list, ignore_index=True)
-        pref_agg = (
-            pref_scores.groupby("prefecture")["score"]
+    def prefecture_scores():
+        pref_scores = multi_choice_answers(df_filtered, "most_wanted_pref_to_visit", "prefecture")
+        pref_scores["score"] = 1  # every chosen region counts once
+        return (
+            pref_scores.groupby("prefecture", observed=True)["score"]
             .sum()
             .reset_index()
             .sort_values("score", ascending=False)
         )
 
-        # --- Bar chart ---
+    def build_pref():
+        pref_agg = prefecture_scores()
+        if pref_agg.empty:
+            return None
+
         fig_pref = px.bar(
             pref_agg,
             x="prefecture",
@@ -773,12 +730,10 @@ elif page == "Prefecture Wishlist":
             xaxis_title=get_axis_label("prefecture"),
             yaxis_title="Weighted Score",
         )
-        st.plotly_chart(fig_pref, use_container_width=True)
-
-
+        return fig_pref
 
-        # --- Map of Japan with preferred regions ---
-        st.markdown("### Map of the most desired regions in Japan")
+    def build_map():
+        pref_agg = prefecture_scores()
 
         # Drop 'Unknown' and map coordinates
         map_df = pref_agg[pref_agg["prefecture"] != "Unknown"].copy()
@@ -792,27 +747,35 @@ elif page == "Prefecture Wishlist":
 
         # Remove rows without coordinates
         map_df = map_df.dropna(subset=["lat", "lon"])
+        if map_df.empty:
+            return None
+
+        fig_map = px.scatter_mapbox(
+            map_df,
+            lat="lat",
+            lon="lon",
+            size="score",
+            hover_name="prefecture",
+            hover_data={"lat": False, "lon": False, "score": True},
+            zoom=3.5,
+            center={"lat": 36.0, "lon": 138.0},
+            title="Most desired regions in Japan (weighted by preference score)",
+        )
+        fig_map.update_layout(
+            mapbox_style="open-street-map",
+            margin={"r": 0, "t": 40, "l": 0, "b": 0},
+        )
+        # Force marker color to blue (hex or rgb both work)
+        fig_map.update_traces(marker=dict(color="#bd0404"))
+        return fig_map
 
-        if not map_df.empty:
-            fig_map = px.scatter_mapbox(
-                map_df,
-                lat="lat",
-                lon="lon",
-                size="score",
-                hover_name="prefecture",
-                hover_data={"lat": False, "lon": False, "score": True},
-                zoom=3.5,
-                center={"lat": 36.0, "lon": 138.0},
-                title="Most desired regions in Japan (weighted by preference score)",
-            )
-            fig_map.update_layout(
-                mapbox_style="open-street-map",
-                margin={"r": 0, "t": 40, "l": 0, "b": 0},
-            )
-            # Force marker color to blue (hex or rgb both work)
-            fig_map.update_traces(marker=dict(color="#bd0404"))
-            st.plotly_chart(fig_map, use_container_width=True)
-        else:
+    # --- Bar chart ---
+    if show_figure("prefecture_scores", build_pref) is not None:
+
+        # --- Map of Japan with preferred regions ---
+        st.markdown("### Map of the most desired regions in Japan")
+
+        if show_figure("prefecture_map", build_map) is None:
             st.info("No region coordinates available for the current filters.")
     else:
         st.info("No prefecture preference data available with current filters.")
@@ -858,11 +821,11 @@ elif page == "Custom Funnel":
         col_values = sorted(
             df_filtered[col_name].dropna().unique().tolist()
         )
-        options = ["[Top value]"] + col_values
+        options = [TOP_VALUE] + col_values
         selected_option = st.selectbox(
             f"Step for {col_name}",
             options=options,
-            help="Choose '[Top value]' to automatically use the most frequent value at this step.",
+            help=f"Choose '{TOP_VALUE}' to automatically use the most frequent value at this step.",
         )
         funnel_config[col_name] = selected_option
 
@@ -876,33 +839,11 @@ elif page == "Custom Funnel":
         if len(selected_funnel_cols) == 0:
             st.warning("Please select at least one column for the funnel.")
         else:
+            # Survivors of every step prefix are cached per filter state, so
+            # changing the last steps only computes those steps
+            funnel_key = (data_version(df), canonical_filters(filter_selections))
             if segment_by == "None":
-                df_step = df_filtered.copy()
-                stages = []
-                total_start = len(df_step)
-
-                for col_name in selected_funnel_cols:
-                    if len(df_step) == 0:
-                        break
-
-                    choice = funnel_config[col_name]
-                    if choice == "[Top value]":
-                        vc = df_step[col_name].value_counts(dropna=True)
-                        top_value = vc.idxmax()
-                    else:
-                        top_value = choice
-
-                    df_step = df_step[df_step[col_name] == top_value]
-                    stages.append(
-                        {
-                            "step": col_name,
-                            "value": top_value,
-                            "remaining": len(df_step),
-                            "conversion_rate": len(df_step) / total_start * 100 if total_start else 0,
-                        }
-                    )
-
-                funnel_df = pd.DataFrame(stages)
+                funnel_df = funnel_steps(df_filtered, funnel_config, cache_key=funnel_key)
 
                 fig_funnel = px.funnel(
                     funnel_df,
@@ -915,45 +856,43 @@ elif page == "Custom Funnel":
                     xaxis_title="Remaining Respondents",
                     yaxis_title="Funnel Steps",
                 )
-                st.plotly_chart(fig_funnel, use_container_width=True)
-                st.dataframe(funnel_df, use_container_width=True)
+                render_figure(fig_funnel, "custom_funnel")
+                st.dataframe(funnel_df.drop(columns="start"), use_container_width=True)
 
             else:
-                seg_values = df_filtered[segment_by].dropna().unique().tolist()
-                seg_values = sorted(seg_values)
-
-                all_funnels = []
-
-                for seg_val in seg_values:
-                    df_seg = df_filtered[df_filtered[segment_by] == seg_val]
-                    total_start = len(df_seg)
-                    df_step = df_seg.copy()
-                    for col_name in selected_funnel_cols:
-                        if len(df_step) == 0:
-                            break
-                        choice = funnel_config[col_name]
-                        if choice == "[Top value]":
-                            vc = df_step[col_name].value_counts(dropna=True)
-                            top_value = vc.idxmax()
-                        else:
-                            top_value = choice
-                        df_step = df_step[df_step[col_name] == top_value]
-
-                    all_funnels.append(
-                        {
-                            segment_by: seg_val,
-                            "start": total_start,
-                            "end": len(df_step),
-                            "conversion_rate": len(df_step) / total_start * 100
-                            if total_start
-                            else 0,
-                        }
+                steps_df = funnel_steps(df_filtered, funnel_config, segment_by, cache_key=funnel_key)
+                steps_df = steps_df[steps_df["start"] > 0]
+                steps_df[segment_by] = steps_df[segment_by].astype(str)
+
+                funnels_df = (
+                    steps_df.groupby(segment_by, sort=False)
+                    .agg(
+                        start=("start", "first"),
+                        end=("remaining", "last"),
+                        conversion_rate=("conversion_rate", "last"),
                     )
-
-                funnels_df = pd.DataFrame(all_funnels).sort_values("conversion_rate", ascending=False)
+                    .reset_index()
+                    .sort_values("conversion_rate", ascending=False)
+                )
                 st.markdown("### Funnel conversion rate by segment")
                 st.dataframe(funnels_df, use_container_width=True)
 
+                fig_funnel = px.funnel(
+                    steps_df,
+                    x="remaining",
+                    y="step",
+                    color=segment_by,
+                    title=f"Custom funnel by {get_axis_label(segment_by)}",
+                )
+                fig_funnel.update_layout(
+                    xaxis_title="Remaining Respondents",
+                    yaxis_title="Funnel Steps",
+                )
+                render_figure(fig_funnel, "custom_funnel_by_segment")
+
+                st.markdown("### Step by step")
+                st.dataframe(steps_df.drop(columns="start"), use_container_width=True, hide_index=True)
+
 # ---------------------- Text Insights -----------------------
 elif page == "Text Insights":
     st.title("Text Insights")
@@ -963,34 +902,18 @@ elif page == "Text Insights":
         "'recomendation_to_improve_attractiveness'."
     )
 
-    text_col = "recomendation_to_improve_attractiveness"
-    texts = df_filtered[text_col].dropna().astype(str).tolist()
+    texts = df_filtered[TEXT_COL].dropna()
 
     if len(texts) == 0:
         st.info("No text responses available with current filters.")
     else:
         st.markdown(f"Number of text answers: **{len(texts)}**")
 
-        all_text = " ".join(texts).lower()
-
-        keywords = {
-            "price": ["price", "expensive", "cost", "budget", "prix", "moins cher", "offres", "tarifs", "coût", "abordables", "chère"],
-            "language": ["language", "english", "translation", "anglais", "communiquer", "français", "langue", "anglaise", "étrangers"],
-            "information": ["guide", "planning", "informée"],
-            "crowd": ["crowded", "tourists", "overtourism", "moins de monde", "moins à la mode", "moins touristique"],
-            "transport": ["transport", "train", "shinkansen", "flight", "métro", "vols"],
-            "Do NOT Change": ["rien de plus", "attractif", "m’attirent", "rien", "sur la to do list", "perfect"]
-        }
-
-        keyword_counts = {}
-        for theme, kw_list in keywords.items():
-            count = sum(all_text.count(kw) for kw in kw_list)
-            keyword_counts[theme] = count
-
-        kw_df = (
-            pd.DataFrame(keyword_counts.items(), columns=["theme", "count"])
-            .sort_values("count", ascending=False)
-        )
+        # Tokens and theme hits come from the index built by clean_import.py;
+        # the sidebar filters only select respondents
+        text_index = load_text_index()
+        filtered_ids = None if df_filtered is df else df_filtered["respondent_id"].to_numpy()
+        kw_df = text_index.theme_counts(filtered_ids).sort_values("count", ascending=False)
 
         fig_kw = px.bar(
             kw_df,
@@ -998,17 +921,29 @@ elif page == "Text Insights":
             y="count",
             title="Keyword frequency in recommendations",
             text="count",
+            hover_data=["answers"],
         )
         fig_kw.update_traces(textposition="outside")
         fig_kw.update_layout(
             xaxis_title=get_axis_label("theme"),
             yaxis_title="Keyword Count",
         )
-        st.plotly_chart(fig_kw, use_container_width=True)
+        render_figure(fig_kw, "keyword_themes")
 
         st.markdown("### Raw examples")
-        st.write("Here are a few random answers:")
-        for t in texts[:10]:
+        col_theme, col_keywords = st.columns(2)
+        example_theme = col_theme.selectbox("Theme", ["All themes"] + text_index.themes)
+        example_keywords = col_keywords.text_input("Containing the words", placeholder="e.g. prix, train")
+
+        matched_ids = text_index.select(
+            None if example_theme == "All themes" else example_theme, example_keywords
+        )
+        if matched_ids is None:
+            st.write("Here are a few random answers:")
+        else:
+            texts = texts[df_filtered.loc[texts.index, "respondent_id"].isin(matched_ids)]
+            st.write(f"**{len(texts)}** matching answers, here are a few:")
+        for t in texts.head(10):
             st.markdown(f"- {t}")
 
 # -------------------------- Raw Data ------------------------
@@ -1016,13 +951,71 @@ elif page == "Raw Data":
     st.title("Raw Data")
 
     st.markdown("### 📊 Filtered dataset preview")
-    st.dataframe(df_filtered)
-
-    # Download button
-    csv_bytes = df_filtered.to_csv(index=False).encode("utf-8-sig")
-    st.download_button(
-        label="⬇️ Download filtered data as CSV",
-        data=csv_bytes,
-        file_name="df_clean_filtered.csv",
-        mime="text/csv",
-    )
+
+    # Only the rows of the current page are sent to the browser; the sort
+    # order is computed once per (dataset, filters, column) and cached
+    col_sort, col_order, col_size, col_page = st.columns(4)
+    sort_col = col_sort.selectbox("Sort by", ["(survey order)"] + list(df_filtered.columns))
+    descending = col_order.selectbox("Order", ["Ascending", "Descending"]) == "Descending"
+    page_size = col_size.selectbox("Rows per page", [50, 100, 500, 1000], index=1)
+    n_pages = max(1, -(-len(df_filtered) // page_size))
+    page_number = col_page.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1)
+
+    window = page_window(
+        df_filtered,
+        page_number,
+        page_size,
+        sort_col=None if sort_col == "(survey order)" else sort_col,
+        ascending=not descending,
+        cache_key=(data_version(df), canonical_filters(filter_selections)),
+    )
+    first_row = (page_number - 1) * page_size
+    st.caption(f"Rows {first_row + 1 if len(window) else 0}–{first_row + len(window)} of {len(df_filtered)}")
+    st.dataframe(window)
+
+    # Download button: the file is written only when the button is clicked
+    export_format = st.radio("Download format", ["CSV", "Parquet"], horizontal=True)
+    if export_format == "CSV":
+        st.download_button(
+            label="⬇️ Download filtered data as CSV",
+            data=lambda: export_file(df_filtered, "csv"),
+            file_name="df_clean_filtered.csv",
+            mime="text/csv",
+        )
+    else:
+        st.download_button(
+            label="⬇️ Download filtered data as Parquet",
+            data=lambda: export_file(df_filtered, "parquet"),
+            file_name="df_clean_filtered.parquet",
+            mime="application/vnd.apache.parquet",
+        )
+
+# -----------------------------------------------------------
+# 7. Profiling panel
+# -----------------------------------------------------------
+rerun.lap("page")
+
+if profiling:
+    rerun_summary = RENDER_PROFILER.record(page, rerun)
+    with st.expander(f"⏱️ Render profile: {rerun_summary['total_ms']:.0f} ms", expanded=True):
+        st.markdown("#### This rerun")
+        phases = pd.DataFrame(
+            {
+                "phase": [k[:-3] for k in rerun_summary if k.endswith("_ms") and k != "total_ms"],
+                "ms": [v for k, v in rerun_summary.items() if k.endswith("_ms") and k != "total_ms"],
+            }
+        )
+        st.dataframe(phases.round(1), hide_index=True)
+        if rerun.figures:
+            st.dataframe(pd.DataFrame(rerun.figures).round(1), hide_index=True)
+
+        history = RENDER_PROFILER.history(page)
+        st.markdown(f"#### Last {len(history)} reruns of this page (all sessions)")
+        st.line_chart(history[["total_ms", "page_ms", "figure build_ms", "figure serialization_ms"]])
+        st.dataframe(history.describe(percentiles=[0.5, 0.95]).T.round(1))
+
+        st.markdown("#### All pages")
+        st.dataframe(RENDER_PROFILER.pages().round(1), hide_index=True)
+
+        st.markdown("#### Caches (all sessions)")
+        st.dataframe(cache_stats().round(2), hide_index=True)
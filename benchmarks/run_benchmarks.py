@@ -0,0 +1,187 @@
+"""Benchmarks of the cleaner and dashboard hot paths on synthetic survey exports.
+
+    python benchmarks/run_benchmarks.py --scales 1k,100k --output benchmarks/results.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/results.json
+
+Each scale gets its own synthetic export (see synthetic_survey.py); every benchmark
+reports the min / median wall time of its repeats. Results are written as JSON with
+the commit and library versions, and --compare prints the ratio to a previous file.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import clean_import as ci  # noqa: E402
+import jtsa_data  # noqa: E402
+from synthetic_survey import write_raw  # noqa: E402
+
+SCALES = {"1k": 1_000, "100k": 100_000, "10m": 10_000_000}
+PAGES = ["Overview", "Segments & Cross-Analysis", "Difficulties & Barriers", "Prefecture Wishlist",
+         "Custom Funnel", "Text Insights", "Raw Data"]
+# A typical sidebar selection, resolved on the filter index
+SELECTIONS = {"nationality": ["France", "Japan"], "age_group": ["25-34", "35-44"], "been_to_Japan": []}
+
+
+def timed(func, repeat, setup=None):
+    """Wall times of repeat calls of func(setup()) (or func()), setup not included."""
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg) if setup else func()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+
+
+def bench_cleaner(raw, repeat):
+    renamed = raw.rename(columns=ci.RENAME_COLUMNS)
+    renamed.insert(0, ci.ID_COL, range(len(renamed)))
+    answers = renamed["nationality"].tolist()
+    choices = renamed["most_wanted_pref_to_visit"].tolist()
+    with_multi = ci.clean_multi_choice(renamed)[0]
+    return {
+        "normalize_text": timed(lambda: [ci.normalize_text(v) for v in answers], repeat),
+        "smart_split": timed(lambda: [ci.smart_split(v) for v in choices], repeat),
+        "multi_choice (section 7)": timed(lambda: ci.clean_multi_choice(renamed), repeat),
+        "column_mapping (section 8)": timed(ci.clean_columns, repeat, setup=with_multi.copy),
+        "clean": timed(lambda: ci.clean(raw), repeat),
+    }
+
+
+def bench_save(raw, workdir, repeat):
+    df_clean, df_long = ci.clean(raw)
+    paths = {name: os.path.join(workdir, "data_processed", os.path.basename(path)) for name, path in [
+        ("path", ci.OUTPUT_PATH), ("parquet_path", ci.PARQUET_PATH),
+        ("long_path", ci.MULTI_CHOICE_PATH), ("long_parquet_path", ci.MULTI_CHOICE_PARQUET_PATH)]}
+    os.makedirs(os.path.join(workdir, "data_processed"), exist_ok=True)
+    cube_path, text_index_path = ci.CUBE_PATH, ci.TEXT_INDEX_PATH
+    ci.CUBE_PATH = os.path.join(workdir, cube_path)
+    ci.TEXT_INDEX_PATH = os.path.join(workdir, text_index_path)
+    try:
+        return {"save": timed(lambda: ci.save(df_clean, df_long, **paths), repeat)}
+    finally:
+        ci.CUBE_PATH, ci.TEXT_INDEX_PATH = cube_path, text_index_path
+
+
+def bench_data_layer(workdir, repeat):
+    """Dataset loading and the app's sidebar filtering, with the filtered-rows cache off so every repeat filters."""
+    jtsa_data.FILTER_CACHE = jtsa_data.FigureCache(max_bytes=0, sizeof=jtsa_data.frame_size)
+    parquet = os.path.join(workdir, ci.PARQUET_PATH)
+    df = jtsa_data.load_data(parquet)
+    jtsa_data.filter_index(df)  # built once per dataset by the app, on the first filtered rerun
+
+    return {
+        "read_dataset": timed(lambda: jtsa_data.read_dataset(parquet), repeat),
+        "load_data (cached)": timed(lambda: jtsa_data.load_data(parquet), repeat),
+        "read_multi_choice": timed(
+            lambda: jtsa_data.read_multi_choice(os.path.join(workdir, ci.MULTI_CHOICE_PARQUET_PATH)), repeat),
+        "apply_sidebar_filters": timed(lambda: jtsa_data.filtered_rows(df, SELECTIONS), repeat),
+    }
+
+
+def bench_pages(workdir, repeat):
+    """One full script run per page, with figure and funnel caching off so the aggregations really run."""
+    jtsa_data.FIGURE_CACHE = jtsa_data.FigureCache(max_bytes=0)
+    jtsa_data.FUNNEL_CACHE = jtsa_data.FigureCache(max_bytes=0, sizeof=jtsa_data.funnel_state_size)
+    cwd = os.getcwd()
+    os.chdir(workdir)  # the app reads data_processed/ relative to the working directory
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # deprecation warnings raised by the app's own pandas calls
+            return {f"page: {page}": timed(page_run(page), repeat) for page in PAGES}
+    finally:
+        os.chdir(cwd)
+
+
+def page_run(page):
+    """A function running the app script with page selected in the sidebar."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "JTSA_app.py"), default_timeout=3600)
+    at.run()
+    at.sidebar.selectbox[0].select(page)
+
+    def run_page():
+        at.run()
+        if page == "Custom Funnel":
+            at.button[0].click().run()
+        if at.exception:
+            raise RuntimeError(f"{page}: {at.exception[0].message}")
+    return run_page
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"created": datetime.now(timezone.utc).isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "pandas": pd.__version__, "machine": platform.machine(),
+            "cpus": os.cpu_count()}
+
+
+def run(scale, repeat, pages, data_dir=None):
+    with tempfile.TemporaryDirectory() as workdir:
+        raw_path = os.path.join(data_dir or workdir, f"raw_{scale}.csv")
+        if not os.path.exists(raw_path):
+            write_raw(SCALES[scale], raw_path)
+        results = {"read_raw": timed(lambda: ci.load_raw(raw_path), repeat)}
+        raw = ci.load_raw(raw_path)
+        results.update(bench_cleaner(raw, repeat))
+        results.update(bench_save(raw, workdir, repeat))
+        results.update(bench_data_layer(workdir, repeat))
+        if pages:
+            results.update(bench_pages(workdir, repeat))
+        return results
+
+
+def compare(current, previous):
+    for scale, results in current["results"].items():
+        before = previous.get("results", {}).get(scale, {})
+        print(f"\n{scale} (vs {previous.get('commit')})")
+        for name, result in results.items():
+            ratio = f"{result['median'] / before[name]['median']:6.2f}x" if name in before else "     -"
+            print(f"  {name:<40} {result['median'] * 1000:10.1f} ms  {ratio}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the cleaner and the dashboard on synthetic data.")
+    parser.add_argument("--scales", default="1k,100k", help=f"comma-separated, among {', '.join(SCALES)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-pages", action="store_true", help="skip the Streamlit page runs")
+    parser.add_argument("--data-dir", help="keep the generated exports there and reuse them on the next run")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results.json"))
+    parser.add_argument("--compare", metavar="JSON", help="previous results to compare with")
+    args = parser.parse_args(argv)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    report = environment()
+    report["results"] = {}
+    for scale in args.scales.split(","):
+        print(f"Running {scale}...")
+        report["results"][scale] = run(scale, args.repeat, not args.no_pages, args.data_dir)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    compare(report, previous or {})
+
+
+if __name__ == "__main__":
+    main()
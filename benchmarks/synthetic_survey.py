@@ -0,0 +1,110 @@
+"""Synthetic raw survey export, shaped like the Google Sheets CSV read by clean_import.py.
+
+Answers are drawn from the keys of the COLUMN_MAPPINGS dicts (French and English
+variants), with a share of messy spellings (case, padding, accents) on the columns
+that are normalized, multi-choice lists joined with commas (including answers that
+hold commas inside parentheses) and a share of free text no mapping knows.
+
+    python benchmarks/synthetic_survey.py 100000 raw_100k.csv
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clean_import as ci  # noqa: E402
+
+RAW_NAMES = {clean: raw for raw, clean in ci.RENAME_COLUMNS.items()}
+RAW_AGES = ["18-24 ans", "18-24", "25-34 ans", "25-34", "35-44", "45-54 ans", "55-64", "65 ans et plus",
+            "65+", "Moins de 18 ans"]
+RECOMMENDATIONS = ["Rien de plus", "Moins cher, plus de guides en anglais", "Le Japon est parfait",
+                   "Transport (train, bus) trop cher", "More English signs", "Nothing, it is great!"]
+
+NAN_SHARE = 0.1
+MESSY_SHARE = 0.3
+FREE_TEXT_SHARE = 0.03
+MULTI_CHOICE_POOL = 5000
+
+
+def messy_variants(answer):
+    """Spellings of answer that normalize_text brings back to the mapping key."""
+    return [answer.upper(), f"  {answer.capitalize()} ", answer.replace("e", "é")]
+
+
+def free_text(rng, size):
+    return np.array([f"autre : réponse libre {i}" for i in rng.integers(0, 500, size)], dtype=object)
+
+
+def sample_answers(rng, keys, size, messy):
+    """size answers among keys: clean or messy spellings, free text and missing values."""
+    keys = list(keys)
+    variants = [keys] + ([list(v) for v in zip(*map(messy_variants, keys))] if messy else [])
+    pool = np.array([v for spellings in variants for v in spellings], dtype=object)
+    choice = rng.integers(0, len(keys), size)
+    if messy:
+        use_messy = rng.random(size) < MESSY_SHARE
+        choice[use_messy] += len(keys) * rng.integers(1, len(variants), use_messy.sum())
+    answers = pool[choice]
+    draw = rng.random(size)
+    is_free = draw < FREE_TEXT_SHARE
+    answers[is_free] = free_text(rng, is_free.sum())
+    answers[draw > 1 - NAN_SHARE] = np.nan
+    return answers
+
+
+def sample_multi_choice(rng, keys, size, messy):
+    """size comma-separated answer lists (1 to 7 choices), drawn from a pool of combinations."""
+    keys = list(keys)
+    pool = []
+    for _ in range(MULTI_CHOICE_POOL):
+        k = int(rng.integers(1, min(7, len(keys)) + 1))
+        picks = sample_answers(rng, [keys[i] for i in rng.choice(len(keys), k, replace=False)], k, messy)
+        pool.append(", ".join(str(p) for p in picks if not pd.isna(p)) or np.nan)
+    answers = np.array(pool, dtype=object)[rng.integers(0, MULTI_CHOICE_POOL, size)]
+    answers[rng.random(size) < NAN_SHARE] = np.nan
+    return answers
+
+
+def generate_raw(size, seed=0, start=0):
+    """size raw responses; start offsets the submission timestamps (one every 37 minutes)."""
+    rng = np.random.default_rng([seed, start])
+    columns = {}
+    timestamps = pd.Timestamp("2025-10-01") + pd.to_timedelta(37 * np.arange(start, start + size), unit="min")
+    columns[ci.TIMESTAMP_COL] = timestamps.strftime(ci.TIMESTAMP_FORMAT)
+    for spec in ci.COLUMN_MAPPINGS:
+        cols = spec["columns"]
+        base = cols[0].rsplit("_", 1)[0]
+        if base in ci.MULTI_CHOICE_COLS:
+            columns[RAW_NAMES[base]] = sample_multi_choice(rng, spec["mapping"], size, spec["normalize"])
+        else:
+            for col in cols:
+                columns[RAW_NAMES.get(col, col)] = sample_answers(rng, spec["mapping"], size, spec["normalize"])
+    columns[RAW_NAMES["age_group"]] = sample_answers(rng, RAW_AGES, size, messy=False)
+    columns[RAW_NAMES["recomendation_to_improve_attractiveness"]] = sample_answers(rng, RECOMMENDATIONS, size,
+                                                                                   messy=True)
+    order = [ci.TIMESTAMP_COL] + [c for c in ci.RENAME_COLUMNS if c != ci.TIMESTAMP_COL]
+    return pd.DataFrame(columns)[order]
+
+
+def write_raw(size, path, seed=0, chunksize=1_000_000):
+    """Write size raw responses to path as CSV, chunksize rows at a time."""
+    for start in range(0, size, chunksize):
+        chunk = generate_raw(min(chunksize, size - start), seed, start)
+        chunk.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic raw survey export.")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    write_raw(args.rows, args.path, args.seed)
+
+
+if __name__ == "__main__":
+    main()
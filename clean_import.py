@@ -7,12 +7,35 @@
 # 7. Multi-choice question processing
 # 8. Column-by-column cleaning
 # 9. Delete unnecessary Columns
-# 10. Save CSV file
+# 10. Save CSV & Parquet files
 
 # 1. Imports
+import argparse
+import contextlib
+import cProfile
+import functools
+import hashlib
+import http.client
+import inspect
+import json
+import os
+import pickle
+import time
+from datetime import datetime, timezone
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import re
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import resource  # peak RSS in the run report; not available on Windows
+except ImportError:
+    resource = None
 
 
 # 2. Load data
@@ -20,30 +43,309 @@ file_id = "1lfH64MX8NHuxn7745leZ6LaXRVLAAer77J336ZFOTIk"
 gid = "1900938527"  # onglet cible
 url = f"https://docs.google.com/spreadsheets/d/{file_id}/export?format=csv&gid={gid}"
 
-df = pd.read_csv(url)
-df_clean = pd.DataFrame()
-
-df_clean = df
+OUTPUT_PATH = "data_processed/df_clean.csv"
+PARQUET_PATH = "data_processed/df_clean.parquet"
+# Long form of the multi-choice questions: one (respondent_id, question, rank, value) row per answer
+MULTI_CHOICE_PATH = "data_processed/df_multi_choice.csv"
+MULTI_CHOICE_PARQUET_PATH = "data_processed/df_multi_choice.parquet"
+# Respondent counts behind the dashboard's Segments & Cross-Analysis page
+CUBE_PATH = "data_processed/df_segment_cube.parquet"
+# Inverted index of the free-text answers (tokens and themes -> respondents)
+TEXT_INDEX_PATH = "data_processed/df_text_index.parquet"
+
+# Local copy of the export, refreshed with conditional requests
+RAW_SNAPSHOT_PATH = "data_raw/raw_export.csv"
+# ETag / Last-Modified and SHA-256 of the snapshot, plus the SHA-256 of the last cleaned export
+# and the fingerprint of the code that cleaned it (see code_fingerprint)
+RAW_META_PATH = "data_raw/raw_export.json"
+FETCH_RETRIES = 3
+FETCH_TIMEOUT = 60  # seconds
+# Results of the cleaning stages, filed by a hash of their inputs (see StageCache)
+STAGE_CACHE_DIR = "data_raw/stage_cache"
+STAGE_CACHE_MAX_BYTES = 512 * 2**20
+
+# Timings and memory of the last run, per stage (see RunReport)
+RUN_REPORT_PATH = "data_processed/run_report.json"
+
+# Google Forms submission timestamp, used as the high-water mark in incremental mode
+TIMESTAMP_COL = "Horodateur"
+TIMESTAMP_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+
+def load_raw(source=url, chunksize=None):
+    """Raw export as one DataFrame, or as an iterator of DataFrames of chunksize rows."""
+    if chunksize is not None:
+        return read_chunks(pd.read_csv(source, chunksize=chunksize))
+    with RUN_REPORT.stage("load") as out:
+        df = pd.read_csv(source)
+        out["shape"] = df.shape
+    return df
+
+def read_chunks(reader):
+    """Chunks of a CSV reader, each read timed as a load stage."""
+    with reader:
+        while True:
+            wall, cpu = time.perf_counter(), time.process_time()
+            chunk = next(reader, None)
+            if chunk is None:
+                return
+            RUN_REPORT.add("load", time.perf_counter() - wall, time.process_time() - cpu, chunk.shape)
+            yield chunk
+
+def read_raw_meta(meta_path=RAW_META_PATH):
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path) as f:
+        return json.load(f)
+
+def write_raw_meta(meta, meta_path=RAW_META_PATH):
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def fetch_raw(source=url, path=RAW_SNAPSHOT_PATH, meta_path=RAW_META_PATH,
+              retries=FETCH_RETRIES, timeout=FETCH_TIMEOUT):
+    """Refresh the local snapshot of the export and return its metadata.
+
+    The request carries the ETag / Last-Modified of the previous response, so an unchanged
+    export is answered with 304 and not downloaded again. Otherwise the body is streamed
+    to disk (replacing the snapshot only once complete) and hashed on the way.
+    Network errors and 5xx responses are retried with exponential backoff."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    meta = read_raw_meta(meta_path) if os.path.exists(path) else {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    for attempt in range(retries):
+        try:
+            with urlopen(Request(source, headers=headers), timeout=timeout) as response:
+                digest = hashlib.sha256()
+                size = 0
+                with open(path + ".part", "wb") as f:
+                    for block in iter(lambda: response.read(1 << 16), b""):
+                        digest.update(block)
+                        f.write(block)
+                        size += len(block)
+                # read(n) returns a short body instead of raising when the connection drops
+                expected = response.headers.get("Content-Length")
+                if expected is not None and size != int(expected):
+                    raise http.client.IncompleteRead(b"", int(expected) - size)
+                os.replace(path + ".part", path)
+                meta.update(etag=response.headers.get("ETag"),
+                            last_modified=response.headers.get("Last-Modified"),
+                            sha256=digest.hexdigest())
+            break
+        except HTTPError as e:
+            if e.code == 304:
+                meta.setdefault("sha256", file_sha256(path))
+                break
+            if e.code < 500 or attempt == retries - 1:
+                raise
+        except (OSError, http.client.HTTPException):
+            if attempt == retries - 1:
+                raise
+        time.sleep(2 ** attempt)
+
+    write_raw_meta(meta, meta_path)
+    return meta
+
+def parse_timestamps(s):
+    return pd.to_datetime(s, format=TIMESTAMP_FORMAT, errors="coerce")
+
+def read_high_water_mark(path=OUTPUT_PATH):
+    """Latest Horodateur already in the processed file, or None if there is nothing to append to."""
+    if not os.path.exists(path):
+        return None
+    ts = parse_timestamps(pd.read_csv(path, usecols=[TIMESTAMP_COL])[TIMESTAMP_COL])
+    return ts.max() if ts.notna().any() else None
+
+def read_processed_counts(high_water_mark, path=OUTPUT_PATH):
+    """Processed rows stamped high_water_mark, and processed rows without a parsable Horodateur."""
+    ts = parse_timestamps(pd.read_csv(path, usecols=[TIMESTAMP_COL])[TIMESTAMP_COL])
+    return {"at_mark": int((ts == high_water_mark).sum()), "unparsed": int(ts.isna().sum())}
+
+def select_new_rows(df, high_water_mark, seen=None):
+    """Rows not processed yet: stamped at or after high_water_mark, or without a parsable Horodateur.
+
+    Raw rows get their respondent_id only when they are cleaned, so the rows at the mark
+    or without a timestamp that are already processed are skipped by occurrence: seen
+    (from read_processed_counts) holds how many of each come first in the export, and is
+    used up as the rows go by, across the chunks of one export."""
+    if high_water_mark is None:
+        return df
+    ts = parse_timestamps(df[TIMESTAMP_COL])
+    keep = (ts >= high_water_mark) | ts.isna()
+    if seen:
+        for key, rows in [("at_mark", ts == high_water_mark), ("unparsed", ts.isna())]:
+            skip = min(seen[key], int(rows.sum()))
+            if skip:
+                keep &= ~(rows & (rows.cumsum() <= skip))
+                seen[key] -= skip
+    RUN_REPORT.count("new rows without timestamp", int((keep & ts.isna()).sum()))
+    return df[keep]
+
+def read_next_respondent_id(path=OUTPUT_PATH):
+    """First respondent_id not used yet by the processed file (0 if it has no id column)."""
+    ids = pd.read_csv(path, usecols=lambda c: c == ID_COL)
+    if ID_COL not in ids or ids[ID_COL].isna().all():
+        return 0
+    return int(ids[ID_COL].max()) + 1
 
 
 # 3. Variables
 MAX_CHOICES = 5
 MAX_CHOICES_DIFF = 5
 
+RATING_COLS = ['rating_interest_culture_and_history', 'rating_interest_food',
+       'rating_interest_nature_hiking', 'rating_interest_shopping_and_techno',
+       'rating_interest_events_and_festivals', 'rating_interest_wellness',
+       'rating_interest_theme_park']
+
+# Row number of a response in df_clean.csv, links it to its rows in df_multi_choice.csv
+ID_COL = "respondent_id"
+
+# Multi-choice questions, split into <name>_1 .. <name>_k columns
+MULTI_CHOICE_COLS = {
+    "most_wanted_pref_to_visit": MAX_CHOICES,
+    "Japan_most_difficulties": MAX_CHOICES_DIFF,
+    "alt_dest_most_difficulties": MAX_CHOICES_DIFF,
+}
+
+# Free-text columns, every other column is a closed set of answers
+TEXT_COL = "recomendation_to_improve_attractiveness"
+TEXT_COLS = [TIMESTAMP_COL, TEXT_COL]
+
+# Themes of the TEXT_COL answers (dashboard's Text Insights page); keywords match whole words
+TEXT_THEMES = {
+    "price": ["price", "expensive", "cost", "budget", "prix", "moins cher", "offres", "tarifs", "coût", "abordables", "chère"],
+    "language": ["language", "english", "translation", "anglais", "communiquer", "français", "langue", "anglaise", "étrangers"],
+    "information": ["guide", "planning", "informée"],
+    "crowd": ["crowded", "tourists", "overtourism", "moins de monde", "moins à la mode", "moins touristique"],
+    "transport": ["transport", "train", "shinkansen", "flight", "métro", "vols"],
+    "Do NOT Change": ["rien de plus", "attractif", "m’attirent", "rien", "sur la to do list", "perfect"],
+}
+
+# Dashboard sidebar filters
+FILTER_COLS = ["nationality", "country", "age_group", "household_income_in_€",
+               "been_to_Japan", "travel_frequency"]
+
+# Columns crossed on the dashboard's Segments & Cross-Analysis page
+SEGMENT_COLS = ["age_group", "household_income_in_€", "travel_frequency", "been_to_Japan",
+                "Japan_vac_duration", "Japan_budget_per_week", "country", "nationality",
+                "family_situation", "Japan_prefered_accomodation", "alternative_destination",
+                "alt_dest_budget_per_week", "alt_dest_prefered_accomodation",
+                "most_influencial_reason_to_choose_dest"]
+
+# Display order of the ordinal answers (also used by the dashboard)
+CATEGORY_ORDERS = {
+    "age_group": ["18-24", "25-34", "35-44", "45-54", "55-64", "65 and over"],
+    "household_income_in_€": [
+        "1500 and less",
+        "1500-1999",
+        "2000-2499",
+        "2500-2999",
+        "3000-3999",
+        "4000–4999",
+        "5000–5999",
+        "6000–6999",
+        "7000 and more",
+        "Unknown",
+    ],
+    "travel_frequency": [
+        "Several times a year",
+        "Once a year",
+        "Every 2–3 years",
+        "Once every 5 years or more",
+        "Never",
+    ],
+    "Japan_vac_duration": [
+        "1 week",
+        "2 weeks",
+        "3 weeks",
+        "4 weeks",
+        "More than 4 weeks",
+        "I don’t know yet / Not sure",
+    ],
+    "Japan_budget_per_week": [
+        "Less than 500",
+        "500-1000",
+        "1000-1500",
+        "1500-2500",
+        "More than 2500",
+        "Unknown",
+    ],
+    "alt_dest_budget_per_week": [
+        "Less than 500",
+        "500-1000",
+        "1000-1500",
+        "1500-2500",
+        "More than 2500",
+    ],
+    "been_to_Japan": [
+        "No, and I’m not interested",
+        "No, but I would like to go",
+        "Yes, once",
+        "Yes, several times",
+    ],
+}
+
+LIKERT_ORDER = ["Not important at all", "Slightly important", "Moderately important",
+                "Very important", "Essential"]
+
+# Ratings are saved as their Likert score, 1 (LIKERT_ORDER[0]) to 5; other answers become missing
+LIKERT_SCORES = {answer: score for score, answer in enumerate(LIKERT_ORDER, start=1)}
+
+# Composite interest scores: mean of the answered ratings of each group (missing if none is answered)
+INTEREST_SCORES = {
+    "overall_interest_score": RATING_COLS,
+    "interest_culture_food": ["rating_interest_culture_and_history", "rating_interest_food"],
+    "interest_nature_wellness": ["rating_interest_nature_hiking", "rating_interest_wellness"],
+    "interest_urban_entertainment": ["rating_interest_shopping_and_techno",
+                                     "rating_interest_events_and_festivals", "rating_interest_theme_park"],
+}
+
+# Numeric columns of df_clean, every other answer column is categorical
+NUMERIC_DTYPES = {**dict.fromkeys(RATING_COLS, "Int8"), **dict.fromkeys(INTEREST_SCORES, "float32")}
+
 
 # 4. Global cleaning helpers (functions)
+# Accents folded and symbols dropped by normalize_text, applied in a single str.translate pass
+NORMALIZE_TABLE = str.maketrans({
+    "à": "a", "â": "a", "ä": "a",
+    "é": "e", "è": "e", "ê": "e", "ë": "e",
+    "ï": "i", "î": "i",
+    "ô": "o",
+    "ù": "u", "û": "u", "ū": "u",
+    "ç": "c",
+    "$": None, "€": None, "-": " ", "–": " ",
+})
+
 def normalize_text(s):
     if pd.isna(s): return s
-    return (str(s)
-            .strip()
-            .lower()
-            .replace("à", "a").replace("â", "a").replace("ä", "a")
-            .replace("é", "e").replace("è", "e").replace("ê", "e").replace("ë", "e")
-            .replace("ï", "i").replace("î", "i")
-            .replace("ô", "o")
-            .replace("ù", "u").replace("û", "u").replace("ū", "u")
-            .replace("ç", "c")
-            .replace("$", "").replace("€", "").replace("-"," ").replace("–"," "))
+    return str(s).strip().lower().translate(NORMALIZE_TABLE)
+
+def take_codes(values, codes, mapped_uniques):
+    """Rebuild a Series/DataFrame shaped like values from factorize codes and one result per unique."""
+    # code -1 (missing) picks the trailing NaN
+    mapped = np.array(list(mapped_uniques) + [np.nan], dtype=object)[codes]
+    if isinstance(values, pd.DataFrame):
+        return pd.DataFrame(mapped.reshape(values.shape), index=values.index, columns=values.columns)
+    return pd.Series(mapped, index=values.index, name=values.name)
+
+def map_unique(values, func):
+    """Apply func once per distinct value of a Series or DataFrame instead of once per cell."""
+    codes, uniques = pd.factorize(values.to_numpy().ravel())
+    return take_codes(values, codes, [func(u) for u in uniques])
 
 def clean_age (age):
     if pd.isna(age):
@@ -64,29 +366,192 @@ def clean_age (age):
     else:
         return "18 and less"
 
+# Commas inside parentheses belong to the answer ("Kyushu (Fukuoka, Nagasaki, Beppu)")
+MULTI_CHOICE_SEPARATOR = r',(?![^()]*\))'
+
 def smart_split(val):
     if pd.isna(val):
         return[]
     s = str(val)
-    parts = re.split(r',(?![^()]*\))', s)
+    parts = re.split(MULTI_CHOICE_SEPARATOR, s)
     parts = [p.strip() for p in parts if p.strip()]
     return parts
 
-def list_to_fixed_cols_prefs(lst, k=MAX_CHOICES):
-    lst = (lst + [np.nan]*k) [:k]
-    return pd.Series(lst, index=[f"most_wanted_pref_to_visit_{i+1}" for i in range(k)])
-
-def list_to_fixed_cols_japan_diffs(lst, k=MAX_CHOICES_DIFF):
-    lst = (lst + [np.nan]*k) [:k]
-    return pd.Series(lst, index=[f"Japan_most_difficulties_{i+1}" for i in range(k)])
-
-def list_to_fixed_cols_alt_diffs(lst, k=MAX_CHOICES_DIFF):
-    lst = (lst + [np.nan]*k) [:k]
-    return pd.Series(lst, index=[f"alt_dest_most_difficulties_{i+1}" for i in range(k)])
+def explode_multi_choice(s):
+    """Long form of a multi-choice column: one answer per row, indexed by (row position, rank from 0).
+
+    Same answers as smart_split, computed for the whole column at once."""
+    s = s.reset_index(drop=True).dropna().astype(str)
+    parts = s.str.split(MULTI_CHOICE_SEPARATOR, regex=True).explode().str.strip()
+    parts = parts[parts.notna() & (parts != "")]
+    rank = parts.groupby(level=0).cumcount()
+    return parts.set_axis(pd.MultiIndex.from_arrays([parts.index, rank.to_numpy()], names=["row", "rank"]))
+
+@functools.cache
+def source_of(func):
+    return inspect.getsource(func)
+
+def stage_key(stage, inputs):
+    """SHA-256 of a stage name and of everything it reads.
+
+    inputs may hold DataFrames / Series (hashed by content, not by index), functions
+    (hashed by source code, so editing one invalidates its results) and plain values
+    such as mapping dicts (hashed by repr)."""
+    digest = hashlib.sha256(f"{stage}|pandas {pd.__version__}".encode())
+    for part in inputs:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            frame = part.to_frame() if isinstance(part, pd.Series) else part
+            digest.update(repr((list(frame.columns), [str(d) for d in frame.dtypes])).encode())
+            digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+            # Missing answers and a literal "None" answer hash alike otherwise
+            digest.update(np.packbits(frame.isna().to_numpy()).tobytes())
+        elif callable(part):
+            digest.update(source_of(part).encode())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"|")
+    return digest.hexdigest()
+
+class StageCache:
+    """Content-addressed store of stage results, pickled under path.
+
+    A stage run on the same inputs as a previous one (same rows, same mapping, same code)
+    gets its previous result back instead of recomputing it, so editing one mapping only
+    recomputes the columns it cleans. Least recently used entries are pruned past max_bytes."""
+    MISSING = object()
+
+    def __init__(self, path=STAGE_CACHE_DIR, max_bytes=STAGE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def entry(self, key):
+        return os.path.join(self.path, key[:2], key + ".pkl")
+
+    def load(self, key):
+        try:
+            with open(self.entry(key), "rb") as f:
+                value = pickle.load(f)
+        except Exception:
+            # Missing, or written by an incompatible version: computed again
+            self.misses += 1
+            return self.MISSING
+        os.utime(self.entry(key))
+        self.hits += 1
+        return value
+
+    def store(self, key, value):
+        entry = self.entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp = f"{entry}.{os.getpid()}.tmp"  # worker processes may store the same key
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, entry)
+
+    def run(self, stage, inputs, compute):
+        key = stage_key(stage, inputs)
+        value = self.load(key)
+        if value is self.MISSING:
+            value = compute()
+            self.store(key, value)
+        return value
+
+    def prune(self):
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                st = os.stat(os.path.join(root, name))
+                entries.append((st.st_mtime, st.st_size, os.path.join(root, name)))
+        total = 0
+        for _, size, entry in sorted(entries, reverse=True):
+            total += size
+            if total > self.max_bytes:
+                os.remove(entry)
+
+def run_stage(cache, stage, inputs, compute):
+    """compute(), or the result it gave on the same inputs when a StageCache is given."""
+    if cache is None:
+        return compute()
+    return cache.run(stage, inputs, compute)
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / 2**20 if os.uname().sysname == "Darwin" else peak / 2**10, 1)
+
+class RunReport:
+    """Wall time, CPU time, peak RSS and output shape of every stage of a run.
+
+    A stage run several times (once per chunk, once per question...) is summed up:
+    calls, times and rows add up, the peak RSS is the highest seen at the end of a
+    call and rss_growth_mb is how much the stage itself raised that peak."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = datetime.now(timezone.utc)
+        self.clock = time.perf_counter(), time.process_time()
+        self.stages = {}
+        self.counts = {}
+
+    def count(self, name, n):
+        """Add n to the counter name (rows set apart by a stage, reported next to the stages)."""
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def add(self, name, wall, cpu, shape=None, rss_growth=0.0):
+        record = self.stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "rows": None,
+                                               "columns": None, "peak_rss_mb": None, "rss_growth_mb": 0.0})
+        record["calls"] += 1
+        record["wall_s"] += wall
+        record["cpu_s"] += cpu
+        if shape is not None:
+            record["rows"] = (record["rows"] or 0) + shape[0]
+            record["columns"] = shape[1] if len(shape) > 1 else 1
+        record["peak_rss_mb"] = peak_rss_mb()
+        record["rss_growth_mb"] += rss_growth
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the body as stage name; set out["shape"] to record the shape of its output."""
+        out = {}
+        wall, cpu, rss = time.perf_counter(), time.process_time(), peak_rss_mb()
+        yield out
+        growth = 0.0 if rss is None else peak_rss_mb() - rss
+        self.add(name, time.perf_counter() - wall, time.process_time() - cpu, out.get("shape"), growth)
+
+    def merge(self, stages):
+        """Add the stages recorded by another process (a cleaning worker)."""
+        for name, other in stages.items():
+            record = self.stages.setdefault(name, dict(other, calls=0, wall_s=0.0, cpu_s=0.0, rows=None,
+                                                       rss_growth_mb=0.0))
+            for key in ["calls", "wall_s", "cpu_s", "rss_growth_mb"]:
+                record[key] += other[key]
+            if other["rows"] is not None:
+                record["rows"] = (record["rows"] or 0) + other["rows"]
+            peaks = [p for p in (record["peak_rss_mb"], other["peak_rss_mb"]) if p is not None]
+            record["peak_rss_mb"] = max(peaks, default=None)
+
+    def to_dict(self, **info):
+        wall, cpu = self.clock
+        return {"started": self.started.isoformat(timespec="seconds"),
+                "wall_s": round(time.perf_counter() - wall, 3), "cpu_s": round(time.process_time() - cpu, 3),
+                "peak_rss_mb": peak_rss_mb(), **info, "counts": self.counts,
+                "stages": {name: {k: round(v, 3) if isinstance(v, float) else v for k, v in record.items()}
+                           for name, record in self.stages.items()}}
+
+    def write(self, path=RUN_REPORT_PATH, **info):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(**info), f, indent=2)
+
+RUN_REPORT = RunReport()
 
 
 # 5. Renaming columns
-df_clean = df_clean.rename(columns={
+RENAME_COLUMNS = {
     "Quel est votre nationalité?": "nationality",
     "  Dans quel pays résidez-vous actuellement ?  ": "country",
     "Quelle est votre tranche d’âge ?  ": "age_group",
@@ -116,545 +581,686 @@ df_clean = df_clean.rename(columns={
     "Parmi les éléments suivants, lequel influence le plus votre choix de destination de vacances (hors Japon) ? ": "most_influencial_reason_to_choose_dest",
     "Lorsque vous voyagez en dehors du Japon, quelles sont les principales difficultés que vous rencontrez habituellement ?\n(Choisissez jusqu’à 3 réponses)": "alt_dest_most_difficulties",
     "Qu’est-ce qui rendrait le Japon plus attractif comme destination pour vous ?  ": "recomendation_to_improve_attractiveness"
-})
-
-
-# 6. Mappings
-# Country + Origins (normalize_text)
-mapping = {
-    #France
-    "france": "France",
-    "francais": "France",
-    "francaise": "France",
-    "french": "France",
-    "法国": "France",
-    "fucking french": "France",
-
-    #China
-    "chine": "China",
-    "chinoise": "China",
-    "chinois": "China",
-    "中国": "China",
-    "chinese": "China",
-
-    #Taiwan
-    "taiwan": "Taiwan",
-    "taiwanais": "Taiwan",
-    "taiwanaise": "Taiwan",
-
-    #Vietnam
-    "vietnam": "Vietnam",
-    "vietnamien": "Vietnam",
-    "vietnamienne": "Vietnam",
-
-    #Portugal
-    "portuguese": "Portugal",
-
-    #Israel
-    "israel": "Israel",
-    "israelien": "Israel",
-    "israelienne": "Israel",
-
-    #Spain
-    "espagne": "Spain",
-
-    #Germany
-    "allemagne": "Germany",
-
-    #USA
-    "united states of america my friend": "USA",
-}
-
-# family_situation
-family_situation_map = {
-    
-    "Single": "Single",
-    "Célibataire": "Single",
-
-    "En couple sans enfant": "Relationship_no_kids",
-    "In a relationship, no children": "Relationship_no_kids",
-
-    "En couple avec enfant(s)": "Relationship_with_kids",
-    "In a relationship, with children": "Relationship_with_kids",
-
-    "Marié(e)/Pacsé(e) sans enfant": "Married_no_kids",
-    "Married / in a civil partnership, no children": "Married_no_kids",
-
-    "Marié(e)/Pacsé(e) avec enfant(s)": "Married_with_kids",
-    "Married / in a civil partnership, with children": "Married_with_kids",
-
-    "Préfère ne pas répondre": "Unknown",
-    "Prefer not to say": "Unknown"
-}
-
-# household_income_in_€
-clean_income = {
-    
-    "Moins de 1 500 €": "1500 and less",
-    "Less than $1,700 (~€1,500)": "1500 and less",
-
-    "1 500 – 1 999 €": "1500-1999",
-    "$1,700 – $2,200 (~€1,500 – €1,999)": "1500-1999",
-
-    "2 000 – 2 499 €": "2000-2499",
-    "$2,200 – $2,700 (~€2,000 – €2,499)": "2000-2499",
-
-    "2 500 – 2 999 €": "2500-2999",
-    "$2,800 – $3,300 (~€2,500 – €2,999)": "2500-2999",
-
-    "3 000 – 3 999 €": "3000-3999",
-    "$3,400 – $4,400 (~€3,000 – €3,999)": "3000-3999",
-
-    "4 000 – 4 999 €": "4000–4999",
-    "$4,500 – $5,500 (~€4,000 – €4,999)": "4000–4999",
-
-    "5000 – 5 999 €": "5000–5999",
-    "$5,600 – $6,600 (~€5,000 – €5,999)": "5000–5999",
-
-    "6 000 – 6 999 €": "6000–6999",
-    "$6,700 – $7,700 (~€6,000 – €6,999)": "6000–6999",
-
-    "Supérieur à 7 000 €": "7000 and more",
-    "More than $7,800 (~€7,000+)": "7000 and more",
-
-    "Préfère ne pas répondre": "Unknown",
-    "Prefer not to say": "Unknown",
-}
-
-# travel_frequency 
-clean_travel_frequency = {
-    
-    "Jamais": "Never",
-    "Une fois tous les 5 ans ou plus": "Once every 5 years or more",
-    "Tous les 2–3 ans": "Every 2–3 years",
-    "Une fois par an": "Once a year",
-    "Plusieurs fois par an": "Several times a year",
-}
-
-# been_to_Japan 
-clean_been_to_japan = {
-
-    "Oui, une fois": "Yes, once",
-    "Oui, plusieurs fois": "Yes, several times",
-    "Non, mais j’aimerais y aller": "No, but I would like to go",
-    "Non, et je ne suis pas intéressé": "No, and I’m not interested",
-}
-
-# Japan_vac_duration
-clean_Japan_vac_duration = {
-    
-    "1 semaine": "1 week",
-    "2 semaines": "2 weeks",
-    "3 semaines": "3 weeks",
-    "4 semaines": "4 weeks",
-    "Plus de 4 semaines": "More than 4 weeks",
-    "Je ne sais pas / Pas assez renseigné": "I don’t know yet / Not sure"
-}
-
-# most_wanted_pref_to_visit_* 
-clean_most_wanted_pref_to_visit = {
-    
-    "Tokyo et sa région (Kanto)": "Kanto",
-    "Tokyo and its region (Kanto)": "Kanto",
-
-    "Kyoto / Osaka / Nara (Kansai)": "Kansai",
-
-    "Région du Tohoku (ex. Yamagata, Sendai)": "Tohoku",
-    "Tohoku region (e.g. Yamagata, Sendai)": "Tohoku",
-
-    "Chūgoku (Hiroshima, Miyajima, Okayama, Matsue)": "Chūgoku",
-
-    "Shikoku (île du pèlerinage des 88 temples, Matsuyama, Iya Valley)": "Shikoku",
-    "Shikoku (88 Temple Pilgrimage Island, Matsuyama, Iya Valley)": "Shikoku",
-
-    "Chūbu (Nagoya, Alpes japonaises, Kanazawa, Takayama, Mont Fuji côté Yamanashi/Shizuoka)": "Chūbu",
-    "Chubu (Nagoya, Japanese Alps, Kanazawa, Takayama, Mt. Fuji – Yamanashi/Shizuoka side)": "Chūbu",
-
-    "Hokkaido": "Hokkaido",
-    "Okinawa": "Okinawa",
-
-    "Kyushu (Fukuoka, Nagasaki, Beppu)": "Kyushu",
-
-    "Je n’ai pas encore d’idée précise, j’ai besoin d’y réfléchir ou de me renseigner.": "Unknown",
-    "j’ai besoin d’y réfléchir ou de me renseigner.": None,
-    "Je n’ai pas encore d’idée précise": None,
-    "I don’t have a clear idea yet / I need to think or find out more": "Unknown",
-}
-
-#rating_interest_*
-clean_rating_japan = {
-
-    "Pas du tout important": "Not important at all",
-    "Peu important": "Slightly important",
-    "Assez important": "Moderately important",
-    "Très important": "Very important",
-    "Essentiel": "Essential",
 }
 
-# Japan_budget_per_week 
-clean_budget_japan = {
-
-    "Moins de 500 €": "Less than 500",
-    "Less than $550 (~€500)": "Less than 500",
-
-    "500 – 1 000 €": "500-1000",
-    "$550 – $1,100 (~€500 – €1,000)": "500-1000",
-
-    "1 000 – 1 500 €": "1000-1500",
-    "$1,100 – $1,650 (~€1,000 – €1,500)": "1000-1500",
-
-    "1 500 – 2 500 €": "1500-2500",
-    "$1,650 – $2,750 (~€1,500 – €2,500)": "1500-2500",
-
-    "Plus de 2 500 €": "More than 2500",
-    "More than $2,750 (~€2,500+)": "More than 2500",
-
-    "Je ne sais pas / Pas assez renseigné": "Unknown",
-    "I don’t know / Not sure yet": "Unknown",
-}
-
-#Japan_prefered_accomodation (normalize_text) 
-clean_japan_accomodation = {
-
-    "hotel classique (3 4 etoiles)": "Standard hotel (3–4 stars)",
-    "hotel haut de gamme / luxe (5 etoiles)": "Luxury / high-end hotel (5 stars)",
-    "ryokan (auberge traditionnelle)": "Ryokan (traditional Japanese inn)",
-    "capsule hotel": "Capsule hotel",
-    "airbnb / logement chez l’habitant": "Airbnb / homestay",
-    "hostel/ auberge de jeunesse": "Hostel"
-}
-
-# Japan_most_difficulties_* (normalize_text) 
-clean_most_difficulties = {
-    
-    "la barriere de la langue": "Language",
-    "the language barrier": "Language",
-    
-    "les difficultes liees aux transports (train, navigation, reservations)": "Transportation",
-    "difficulties with transportation (trains, navigation, reservations)": "Transportation",
-
-    "les problemes lies a la location de voiture (permis international, conduite a gauche, etc.)": "Car rental",
-    "problems with car rental (international license, driving on the left, etc.)": "Car rental",
-    
-    "le cout de la vie sur place (hebergement, restauration, activites)": "Expensive",
-    "the cost of living (accommodation, food, activities)": "Expensive",
-    "expensive": "Expensive",
-
-    "l’affluence touristique (lieux bondes, files d’attente)": "Crowded/Popularity",
-    "tourist crowds (busy places, long queues)": "Crowded/Popularity",
-
-    "le manque d’information touristique en francais/anglais": "Translation",
-    "lack of tourist information in english or french": "Translation",
-
-    "没兴趣": None,
-    "catastrophe naturelle": "Disaster",
-    "c'est la destination trop a la mode que tout le monde veut faire. je prefere les destinations qui sortent du lot.": "Crowded/Popularity",
-    "les insupportables fans du japon": "Crowded/Popularity"
-}
-
-# alternative_destination (normalize_text)
-clean_alternative_destination = {
-    
-    "coree du sud": "South Korea",
-    "south korea": "South Korea",
-
-    "chine": "China",
-    "china": "China",
-
-    "thailande": "Thailand",
-
-    "vietnam": "Vietnam",
-
-    "autres pays d’asie": "Asia",
-    "other asian countries": "Asia",
-    "asia": "Asia",
-
-    "usa / canada": "USA / Canada",
-    "usa": "USA / Canada",
-    "canada": "USA / Canada",
-
-    "europe": "Europe",
-}
-
-# alt_dest_main_reason (normalize_text) 
-clean_alt_dest_reason = {
-    
-    # Cost
-    "moins cher": "Cost",
-    "cheaper": "Cost",
-
-    # Distance / Convenience
-    "plus proche": "Convenience",
-    "plus pratique": "Convenience",
-
-    # Familiarity
-    "deja familier": "Familiarity",
-    "already familiar with the destination": "Familiarity",
-
-    # Social Influence
-    "influence des amis/de la famille": "Social",
-    "influence from friends or family": "Social",
-
-    # Nature / landscapes
-    "l'asie en general m'attire enormement et j'ai vu dans des reportages des endroits de chine merveilleux que j'aimerais decouvrir !": "Nature",
-    "pour l'histoire, les paysages,...": "Nature",
-    "paysages": "Nature",
-    "grands espaces": "Nature",
-
-    # Cultural interest
-    "drama et k pop": "Cultural",
-    "k pop": "Cultural",
-    "kpop": "Cultural",
-    "plus d'interet personnelle, moins touristique et plus singulier": "Cultural",
-
-    # No specific reason
-    "grand interet": "None",
-    "没兴趣": "None",
-    "aucune": "None",
-    "pas trop de raisons particulieres si ce n'est qu'ils sont cousins francais :)": "None",
-}
-
-#alt_dest_prefered_accomodation (normalize_text) 
-clean_alt_pref_accomodation = {
-    
-    "hotel classique (3 4 etoiles)": "Standard hotel (3–4 stars)",
-    "hotel haut de gamme / luxe (5 etoiles)": "Luxury / high-end hotel (5 stars)",
-    "location type airbnb / appartement": "Airbnb-style rental / apartment",
-    "auberge de jeunesse": "Hostel",
-    "resort / club vacances": "Resort / holiday club",
-}
-
-# alt_dest_transportation (normalize_text) 
-clean_alt_dest_transport = {
-
-    "transport en commun (bus, metro, train)": "Public transportation",
-    "public transportation (bus, subway, train)": "Public transportation",
-
-    "voiture de location": "Rental",
-    "rental car": "Rental",
-
-    "taxi / vtc (uber, grab…)": "Taxi",
-    "taxi / ride hailing service (uber, grab, etc.)": "Taxi",
-
-    "bus touristiques / circuits organises": "Organized tours",
-    "tourist buses / organized tours": "Organized tours",
-}
-
-# trip_prep 
-clean_trip_prep = {
-    
-    "Agence de voyages": "Agency",
-    "Travel agency": "Agency",
-
-    "Sites spécialisés (Voyageurs du Monde, Comptoir des Voyages…)": "Websites",
-    "Specialized travel websites (e.g. Audley Travel, Intrepid Travel, Responsible Travel, etc.)": "Websites",
-
-    "Réseaux sociaux / influenceurs": "Influencers",
-    "Social media / influencers": "Influencers",
-
-    "Blogs de voyage": "Blogs",
-    "Travel blogs": "Blogs",
-
-    "Guides papier (Lonely Planet, Routard…)": "Books",
-    "Printed travel guides (e.g. Lonely Planet, Routard, etc.)": "Books",
-
-    "Bouche-à-oreille / amis": "Social",
-    "Word of mouth / friends": "Social",
-}
-
-# most_influencial_reason_to_choose_dest (normalize_text)
-clean_most_influencial_reason_to_choose_dest = {
-    
-    "decouvrir la nature et les paysages": "Nature",
-    "discovering nature and landscapes": "Nature",
-
-    "profiter de la plage et du climat": "Beaches",
-    "enjoying the beach and the climate": "Beaches",
-
-    "explorer le patrimoine culturel et historique (monuments, musees…)": "Cultural",
-    "exploring cultural and historical heritage (monuments, museums, etc.)": "Cultural",
-
-    "decouvrir la gastronomie locale": "Food",
-    "discovering local gastronomy": "Food",
-
-    "vivre une experience unique ou depaysante": "Uniqueness",
-    "experiencing something unique or different": "Uniqueness",
-
-    "rejoindre des proches (famille, amis)": "Family",
-    "visiting relatives or friends": "Family",
-
-    "se detendre / se ressourcer": "Relaxing",
-    "relaxing / recharging": "Relaxing",
-}
-
-# booking_trip_channel (normalize_text) 
-clean_booking_trip_channel = {
-    
-    "agence en ligne (ex. expedia, booking.com)": "Online agency",
-    "online travel agency (e.g. expedia, booking.com)": "Online agency",
-
-    "site officiel de compagnies aeriennes ou hotels": "Direct",
-    "official airline or hotel website": "Direct",
-
-    "agence de voyages physique": "Store",
-    "physical travel agency": "Store",
-
-    "plateformes collaboratives (airbnb, etc.)": "Platforms",
-    "collaborative platforms (e.g. airbnb, etc.)": "Platforms",
-}
-
-# alt_dest_most_difficulties_* (normalize_text)
-clean_alt_dest_most_difficulties = {
-    
-    "barriere de la langue": "Language",
-    "language barrier": "Language",
-
-    "difficultes avec les transports (train, navigation, reservations)": "Transportation",
-    "transportation issues (train, navigation, reservations)": "Transportation",
-    "combiner toutes les activites avec les lieux d hebergement": "Transportation",
-
-    "problemes lies a la location de voiture (permis international, conduite a gauche, etc.)": "Car rental",
-    "car rental problems (international license, driving on the left, etc.)": "Car rental",
-
-    "cout de la vie (hebergement, nourriture, activites)": "Expensive",
-    "cost of living (accommodation, food, activities)": "Expensive",
-
-    "foule touristique (sites bondes, files d’attente)": "Crowded",
-    "tourist crowds (busy sites, long queues)": "Crowded",
-    "les autres voyageurs": "Crowded",
-
-    "manque d’informations touristiques en anglais": "Translation",
-    "lack of tourist information in english": "Translation",
-
-    "没兴趣": "None",
-    "la meme": "None",
-    "adaptation a la nourriture locale": "Food",
-}
 
+# 6. Mappings
+def multi_choice_columns(name):
+    return [f"{name}_{i+1}" for i in range(MULTI_CHOICE_COLS[name])]
+
+# Mapping dicts and which mapping cleans which columns, kept as data next to this script:
+#   "mappings": {name: {answer: cleaned answer}}, a null cleaned answer blanks the answer
+#   "columns":  one entry per column (or multi-choice "question", for its <name>_1 .. <name>_k block)
+#     mapping:   name of the dict in "mappings"
+#     normalize: answers are looked up through normalize_text
+#     fallback:  "raw" keeps the original answer when the mapping has no (or a null) entry,
+#                "normalized" keeps the looked-up key and lets null entries blank the answer
+# A new survey language only needs its answers added to that file.
+MAPPINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "column_mappings.json")
+
+def load_column_mappings(path=MAPPINGS_PATH):
+    """COLUMN_MAPPINGS entries of the spec file at path, entries naming the same dict sharing it."""
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+    entries = []
+    for entry in spec["columns"]:
+        if entry["fallback"] not in ("raw", "normalized"):
+            raise ValueError(f"{path}: unknown fallback {entry['fallback']!r} for {entry}")
+        columns = multi_choice_columns(entry["question"]) if "question" in entry else entry["columns"]
+        entries.append({"columns": columns, "mapping": spec["mappings"][entry["mapping"]],
+                        "normalize": entry["normalize"], "fallback": entry["fallback"]})
+    return entries
+
+COLUMN_MAPPINGS = load_column_mappings()
 
 
 # 7. Multi-choice question processing
-regions_list = df_clean["most_wanted_pref_to_visit"].apply(smart_split)
-df_prefs = regions_list.apply(list_to_fixed_cols_prefs)
-df_clean = pd.concat([df_clean, df_prefs], axis=1)
-
-diffs_list = df_clean["Japan_most_difficulties"].apply(smart_split)
-df_diffs = diffs_list.apply(list_to_fixed_cols_japan_diffs)
-df_clean = pd.concat([df_clean, df_diffs], axis=1)
-
-alt_dest_diff_list = df_clean["alt_dest_most_difficulties"].apply(smart_split)
-df_alt_dest_diff_list = alt_dest_diff_list.apply(list_to_fixed_cols_alt_diffs)
-df_clean = pd.concat([df_clean, df_alt_dest_diff_list], axis=1)
+def split_multi_choice(df_clean, exploded):
+    """Add the <name>_1 .. <name>_k columns of every multi-choice question (answers past k are dropped)."""
+    blocks = []
+    for name, parts in exploded.items():
+        k = MULTI_CHOICE_COLS[name]
+        wide = (parts[parts.index.get_level_values("rank") < k]
+                .unstack("rank")
+                .reindex(index=range(len(df_clean)), columns=range(k))
+                .astype(object))
+        wide.columns = [f"{name}_{i+1}" for i in range(k)]
+        wide.index = df_clean.index
+        blocks.append(wide)
+    return pd.concat([df_clean] + blocks, axis=1)
+
+def multi_choice_long(df_clean, exploded):
+    """Every cleaned multi-choice answer as a (respondent_id, question, rank, value) row, with no k limit.
+
+    Answers go through the same COLUMN_MAPPINGS entry as the question's <name>_1 .. <name>_k block."""
+    frames = []
+    for name, parts in exploded.items():
+        spec, lookup = mapping_for(f"{name}_1")
+        values = map_answers(parts, spec, lookup)
+        frames.append(pd.DataFrame({
+            ID_COL: df_clean[ID_COL].to_numpy()[parts.index.get_level_values("row")],
+            "question": name,
+            "rank": parts.index.get_level_values("rank") + 1,
+            "value": values.to_numpy(),
+        }))
+    df_long = pd.concat(frames, ignore_index=True).sort_values(ID_COL, kind="stable")
+    return df_long[df_long["value"].notna()].reset_index(drop=True)
+
+def clean_multi_choice(df_clean, cache=None):
+    """split_multi_choice and multi_choice_long, run as one cached stage per question."""
+    blocks, frames = [], []
+    for name in MULTI_CHOICE_COLS:
+        columns = df_clean[[ID_COL, name]].reset_index(drop=True)
+        spec, _ = mapping_for(f"{name}_1")
+
+        def compute():
+            exploded = {name: explode_multi_choice(columns[name])}
+            wide = split_multi_choice(columns, exploded).drop(columns=[ID_COL, name])
+            return wide, multi_choice_long(columns, exploded)
+
+        with RUN_REPORT.stage(f"multi_choice: {name}") as out:
+            wide, df_long = run_stage(cache, "multi_choice", [columns, name, MULTI_CHOICE_COLS[name], spec,
+                                                              *MULTI_CHOICE_STAGE_CODE], compute)
+            out["shape"] = df_long.shape
+        blocks.append(wide.set_axis(df_clean.index))
+        frames.append(df_long)
+    # Same order as one multi_choice_long call over every question
+    df_long = pd.concat(frames, ignore_index=True).sort_values(ID_COL, kind="stable").reset_index(drop=True)
+    return pd.concat([df_clean] + blocks, axis=1), df_long
 
 
 # 8. Column-by-column cleaning
-df_clean["nationality"] = (df_clean["nationality"]
-                               .map(normalize_text)
-                               .map(mapping)
-                               .fillna(df_clean["nationality"]))
-    
-df_clean["country"] = (df_clean["country"]
-                               .map(normalize_text)
-                               .map(mapping)
-                               .fillna(df_clean["country"]))
-    
-df_clean["age_group"] = df_clean["age_group"].apply(clean_age)
-
-df_clean["family_situation"] = (df_clean["family_situation"]
-                            .map(family_situation_map)
-                            .fillna(df_clean["family_situation"]))
-
-df_clean["household_income_in_€"] = (df_clean["household_income_in_€"]
-                            .map(clean_income)
-                            .fillna(df_clean["household_income_in_€"]))
-
-df_clean["travel_frequency"] = (df_clean["travel_frequency"]
-                            .map(clean_travel_frequency)
-                            .fillna(df_clean["travel_frequency"]))
-
-df_clean["been_to_Japan"] = (df_clean["been_to_Japan"]
-                            .map(clean_been_to_japan)
-                            .fillna(df_clean["been_to_Japan"]))
-
-df_clean["Japan_vac_duration"] = (df_clean["Japan_vac_duration"]
-                            .map(clean_Japan_vac_duration)
-                            .fillna(df_clean["Japan_vac_duration"]))
-
-pref_cols = ["most_wanted_pref_to_visit_1", "most_wanted_pref_to_visit_2", "most_wanted_pref_to_visit_3",
-        "most_wanted_pref_to_visit_4", "most_wanted_pref_to_visit_5"]
-df_clean[pref_cols] = (df_clean[pref_cols]
-                            .map(lambda x: clean_most_wanted_pref_to_visit.get(x, x)))
-
-rating_cols = ['rating_interest_culture_and_history', 'rating_interest_food',
-       'rating_interest_nature_hiking', 'rating_interest_shopping_and_techno',
-       'rating_interest_events_and_festivals', 'rating_interest_wellness',
-       'rating_interest_theme_park']
-df_clean[rating_cols] = (df_clean[rating_cols]
-                            .map(lambda x: clean_rating_japan.get(x, x)))
-
-df_clean["Japan_budget_per_week"] = (df_clean["Japan_budget_per_week"]
-                            .map(clean_budget_japan)
-                            .fillna(df_clean["Japan_budget_per_week"]))
-
-df_clean["Japan_prefered_accomodation"] = (df_clean["Japan_prefered_accomodation"]
-                                           .map(normalize_text)
-                                           .map(clean_japan_accomodation)
-                                           .fillna(df_clean["Japan_prefered_accomodation"]))
-
-cols = ["Japan_most_difficulties_1", "Japan_most_difficulties_2", "Japan_most_difficulties_3",
-        "Japan_most_difficulties_4", "Japan_most_difficulties_5"]
-df_clean[cols] = (df_clean[cols]
-                            .map(normalize_text)
-                            .map(lambda x: clean_most_difficulties.get(x, x)))
-
-df_clean["alternative_destination"] = (df_clean["alternative_destination"]
-                            .map(normalize_text)
-                            .map(clean_alternative_destination)
-                            .fillna(df_clean["alternative_destination"]))
-
-df_clean["alt_dest_main_reason"] = (df_clean["alt_dest_main_reason"]
-                            .map(normalize_text)
-                            .map(clean_alt_dest_reason)
-                            .fillna(df_clean["alt_dest_main_reason"]))
-
-df_clean["alt_dest_prefered_accomodation"] = (df_clean["alt_dest_prefered_accomodation"]
-                            .map(normalize_text)
-                            .map(clean_alt_pref_accomodation)
-                            .fillna(df_clean["alt_dest_prefered_accomodation"]))
-
-df_clean["alt_dest_budget_per_week"] = (df_clean["alt_dest_budget_per_week"]
-                            .map(clean_budget_japan)
-                            .fillna(df_clean["alt_dest_budget_per_week"]))
-
-df_clean["alt_dest_transportation"] = (df_clean["alt_dest_transportation"]
-                                       .map(normalize_text)
-                                       .map(clean_alt_dest_transport)
-                                       .fillna(df_clean["alt_dest_transportation"]))
-
-df_clean["trip_prep"] = (df_clean["trip_prep"]
-                            .map(clean_trip_prep)
-                            .fillna(df_clean["trip_prep"]))
-
-df_clean["booking_trip_channel"] = (df_clean["booking_trip_channel"]
-                            .map(normalize_text)
-                            .map(clean_booking_trip_channel)
-                            .fillna(df_clean["booking_trip_channel"]))
-
-df_clean["most_influencial_reason_to_choose_dest"] = (df_clean["most_influencial_reason_to_choose_dest"]
-                            .map(normalize_text)
-                            .map(clean_most_influencial_reason_to_choose_dest)
-                            .fillna(df_clean["most_influencial_reason_to_choose_dest"]))
-
-cols = ["alt_dest_most_difficulties_1", "alt_dest_most_difficulties_2", "alt_dest_most_difficulties_3",
-        "alt_dest_most_difficulties_4", "alt_dest_most_difficulties_5"]
-df_clean[cols] = (df_clean[cols]
-                            .map(normalize_text)
-                            .map(lambda x: clean_alt_dest_most_difficulties.get(x, x)))
-
+def compile_lookup(spec):
+    """Lookup table of one COLUMN_MAPPINGS entry, keys normalized once when answers are."""
+    if spec["normalize"]:
+        return {normalize_text(k): v for k, v in spec["mapping"].items()}
+    return spec["mapping"]
+
+LOOKUPS = [compile_lookup(spec) for spec in COLUMN_MAPPINGS]
+
+def map_answers(values, spec, lookup, unmapped=None):
+    """Clean a column (or a multi-choice block) through its mapping, once per distinct answer.
+
+    Answers missing from the mapping are counted in unmapped (answer -> rows) when given."""
+    codes, uniques = pd.factorize(values.to_numpy().ravel())
+    keys = [normalize_text(u) for u in uniques] if spec["normalize"] else list(uniques)
+    if spec["fallback"] == "raw":
+        # same as .map(lookup).fillna(raw): None targets fall back to the raw answer too
+        cleaned = [u if lookup.get(key) is None else lookup[key] for u, key in zip(uniques, keys)]
+    else:
+        cleaned = [lookup.get(key, key) for key in keys]
+
+    if unmapped is not None:
+        labels = set(lookup.values())
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        for u, key, n in zip(uniques, keys, counts):
+            if key not in lookup and key not in labels and u not in labels:
+                unmapped[u] = unmapped.get(u, 0) + int(n)
+
+    return take_codes(values, codes, cleaned)
+
+def mapping_for(col):
+    """The COLUMN_MAPPINGS entry (and its lookup table) that cleans col."""
+    for spec, lookup in zip(COLUMN_MAPPINGS, LOOKUPS):
+        if col in spec["columns"]:
+            return spec, lookup
+    raise KeyError(col)
+
+def clean_columns(df_clean, unmapped=None, cache=None):
+    """Apply every entry of COLUMN_MAPPINGS, each one as a cached stage.
+
+    unmapped, when given, is filled with {column(s): {answer: rows}} for answers no mapping knows."""
+    with RUN_REPORT.stage("mapping: age_group") as out:
+        ages = df_clean["age_group"]
+        cleaned = run_stage(cache, "age_group", [ages, clean_age, map_unique],
+                            lambda: map_unique(ages, clean_age))
+        df_clean["age_group"] = cleaned.set_axis(ages.index)
+        out["shape"] = cleaned.shape
+
+    for spec, lookup in zip(COLUMN_MAPPINGS, LOOKUPS):
+        cols = spec["columns"]
+        name = cols[0] if len(cols) == 1 else f"{cols[0]} .. {cols[-1]}"
+        with RUN_REPORT.stage(f"mapping: {name}") as out:
+            values = df_clean[cols[0]] if len(cols) == 1 else df_clean[cols]
+            # The report is kept with the result, so cached columns still list their unmapped answers
+            report = {} if unmapped is not None or cache is not None else None
+            cleaned, report = run_stage(cache, "mapping", [values, spec, *MAPPING_STAGE_CODE],
+                                        lambda: (map_answers(values, spec, lookup, report), report))
+            df_clean[cols[0] if len(cols) == 1 else cols] = cleaned.set_axis(values.index)
+            out["shape"] = values.shape
+        if unmapped is not None and report:
+            merge_unmapped(unmapped, {name: report})
+    return df_clean
+
+# Code the cached stages run: editing any of it invalidates their cached results
+MAPPING_STAGE_CODE = (compile_lookup, map_answers, take_codes, normalize_text, NORMALIZE_TABLE)
+MULTI_CHOICE_STAGE_CODE = (explode_multi_choice, MULTI_CHOICE_SEPARATOR, split_multi_choice, multi_choice_long,
+                           *MAPPING_STAGE_CODE)
+
+
+def score_interests(df_clean):
+    """Replace the Likert answers of RATING_COLS by their score and add the INTEREST_SCORES columns."""
+    df_clean = df_clean.copy()
+    for col in RATING_COLS:
+        df_clean[col] = df_clean[col].map(LIKERT_SCORES).astype("Int8")
+    scores = df_clean[RATING_COLS].to_numpy(dtype=np.float64, na_value=np.nan)
+    for name, cols in INTEREST_SCORES.items():
+        block = scores[:, [RATING_COLS.index(col) for col in cols]]
+        answered = (~np.isnan(block)).sum(axis=1)
+        mean = np.divide(np.nansum(block, axis=1), answered, out=np.full(len(block), np.nan), where=answered > 0)
+        df_clean[name] = mean.astype(np.float32)
+    return df_clean
 
 # 9. Delete unnecessary Columns
-df_clean = df_clean.drop(columns= ["most_wanted_pref_to_visit", "Japan_most_difficulties", "alt_dest_most_difficulties"])
+def drop_raw_columns(df_clean):
+    return df_clean.drop(columns= ["most_wanted_pref_to_visit", "Japan_most_difficulties", "alt_dest_most_difficulties"])
+
+
+def clean(df, unmapped=None, first_id=0, cache=None):
+    """Clean raw responses; returns df_clean and the long multi-choice table.
+
+    Responses are numbered from first_id in the respondent_id column. With a StageCache,
+    the multi-choice and mapping stages whose inputs did not change are not recomputed."""
+    with RUN_REPORT.stage("rename") as out:
+        df_clean = df.rename(columns=RENAME_COLUMNS)
+        df_clean.insert(0, ID_COL, np.arange(first_id, first_id + len(df_clean)))
+        out["shape"] = df_clean.shape
+    df_clean, df_long = clean_multi_choice(df_clean, cache)
+    df_clean = clean_columns(df_clean, unmapped, cache)
+    with RUN_REPORT.stage("drop") as out:
+        df_clean = drop_raw_columns(df_clean)
+        out["shape"] = df_clean.shape
+    with RUN_REPORT.stage("interest_scores") as out:
+        df_clean = score_interests(df_clean)
+        out["shape"] = df_clean.shape
+    return df_clean, df_long
+
+
+# 10. Save CSV & Parquet files
+def category_groups(columns):
+    """Group answer columns that share one set of categories (each multi-choice block)."""
+    groups = {}
+    for col in columns:
+        if col in TEXT_COLS or col in NUMERIC_DTYPES or col == ID_COL:
+            continue
+        base = col.rsplit("_", 1)[0]
+        groups.setdefault(base if base in MULTI_CHOICE_COLS else col, []).append(col)
+    return list(groups.values())
+
+def observe_categories(df_clean, observed=None):
+    """Collect the answers of every category group of df_clean into observed ({first column: set})."""
+    observed = {} if observed is None else observed
+    for cols in category_groups(df_clean.columns):
+        values = observed.setdefault(cols[0], set())
+        values.update(v for v in pd.unique(df_clean[cols].to_numpy().ravel()) if not pd.isna(v))
+    return observed
+
+def categorical_dtypes(columns, observed):
+    """dtype of every answer column: NUMERIC_DTYPES for the scores, categories otherwise
+    (ordered for the columns of CATEGORY_ORDERS)."""
+    dtypes = {col: dtype for col, dtype in NUMERIC_DTYPES.items() if col in columns}
+    for cols in category_groups(columns):
+        values = sorted(observed.get(cols[0], ()), key=str)
+        order = CATEGORY_ORDERS.get(cols[0])
+        if order is None:
+            dtype = pd.CategoricalDtype(values)
+        else:
+            # Keep unexpected answers instead of turning them into NaN
+            dtype = pd.CategoricalDtype(order + [v for v in values if v not in order], ordered=True)
+        dtypes.update(dict.fromkeys(cols, dtype))
+    return dtypes
+
+def to_categorical(df_clean, dtypes=None):
+    """Dictionary-encode every answer column (dtypes from categorical_dtypes, computed from df_clean if omitted)."""
+    if dtypes is None:
+        dtypes = categorical_dtypes(df_clean.columns, observe_categories(df_clean))
+    return df_clean.astype(dtypes)
+
+def multi_choice_dtypes(observed):
+    """dtypes of the long multi-choice table, observed being {"question": set, "value": set}."""
+    return {ID_COL: "int32", "question": pd.CategoricalDtype(sorted(observed["question"])),
+            "rank": "int16", "value": pd.CategoricalDtype(sorted(observed["value"]))}
+
+def multi_choice_to_categorical(df_long, dtypes=None):
+    """Compact dtypes of the long multi-choice table (question and value dictionary-encoded)."""
+    if dtypes is None:
+        dtypes = multi_choice_dtypes({col: set(df_long[col].dropna()) for col in ["question", "value"]})
+    return df_long.astype(dtypes)
+
+def segment_cube(df_clean):
+    """Respondent counts for every pair of SEGMENT_COLS, over all the respondents.
+
+    One row per observed (dim_a value, dim_b value) combination, missing values left out.
+    The dashboard reads it while no sidebar filter is set, and groups the filtered rows
+    otherwise: keeping the filter columns in the key would make the cube about as long
+    as the data for every pair."""
+    frames = []
+    for i, dim_a in enumerate(SEGMENT_COLS):
+        for dim_b in SEGMENT_COLS[i + 1:]:
+            keys = [df_clean[dim_a].rename("value_a"), df_clean[dim_b].rename("value_b")]
+            counts = df_clean.groupby(keys, observed=True).size().reset_index(name="count")
+            counts["dim_a"] = dim_a
+            counts["dim_b"] = dim_b
+            frames.append(counts)
+    cube = pd.concat(frames, ignore_index=True)
+    cube = cube[["dim_a", "value_a", "dim_b", "value_b", "count"]]
+    return cube.astype({col: "category" for col in cube.columns if col != "count"} | {"count": "int32"})
+
+def trie_regex(words):
+    """Regex matching any of words, factored as a trie (shared prefixes are tried once).
+
+    Optional tails are greedy, so the longest word matching at a position is tried first."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def branch(node):
+        alternatives = [re.escape(char) + branch(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        if "" in node:
+            return "(?:" + "|".join(alternatives) + ")?"
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return "(?:" + "|".join(alternatives) + ")"
+
+    return branch(trie)
+
+class KeywordMatcher:
+    """Matcher compiled once for a {theme: [keywords]} table, run on normalize_text()-ed answers.
+
+    All keywords go into one trie-shaped regex bounded by non-word characters: a keyword only
+    matches whole words, and where two keywords start at the same place the longest one wins
+    ("rien de plus" is not also counted as "rien")."""
+
+    def __init__(self, themes):
+        self.themes = list(themes)
+        self.theme_of = {normalize_text(kw): i for i, kws in enumerate(themes.values()) for kw in kws}
+        self.pattern = re.compile(r"(?<!\w)" + trie_regex(self.theme_of) + r"(?!\w)")
+
+    def count(self, normalized):
+        """Keyword hits per theme (columns) of every normalized answer (rows, missing ones count 0).
+
+        The answers are scanned as one string; each match is attributed back to its answer
+        from its offset."""
+        texts = normalized.fillna("").tolist()
+        starts = np.cumsum([0] + [len(t) + 1 for t in texts[:-1]])
+        positions, themes = [], []
+        for match in self.pattern.finditer("\n".join(texts)):
+            positions.append(match.start())
+            themes.append(self.theme_of[match.group()])
+        hits = np.zeros((len(texts), len(self.themes)), dtype=np.int32)
+        rows = np.searchsorted(starts, positions, side="right") - 1
+        np.add.at(hits, (rows, np.asarray(themes, dtype=np.intp)), 1)
+        return hits
+
+TEXT_MATCHER = KeywordMatcher(TEXT_THEMES)
+TOKEN_PATTERN = r"\w+"
+
+def text_index(df_clean):
+    """Inverted index of the TEXT_COL answers: one (kind, term, respondent_id, count) row per
+    (normalized token, respondent) and per (TEXT_THEMES theme, respondent) with at least one hit.
+
+    Rows are sorted by kind, term and respondent so that the respondents of a term are one slice."""
+    answers = df_clean[[ID_COL, TEXT_COL]].dropna(subset=[TEXT_COL])
+    normalized = map_unique(answers[TEXT_COL], normalize_text)
+
+    tokens = pd.DataFrame({ID_COL: answers[ID_COL].to_numpy(),
+                           "term": normalized.str.findall(TOKEN_PATTERN).to_numpy()})
+    tokens = tokens.explode("term").dropna(subset=["term"])
+    tokens = tokens.groupby(["term", ID_COL]).size().reset_index(name="count")
+    tokens.insert(0, "kind", "token")
+
+    hits = TEXT_MATCHER.count(normalized)
+    rows, themes = np.nonzero(hits)
+    theme_rows = pd.DataFrame({"kind": "theme", "term": np.asarray(TEXT_MATCHER.themes, dtype=object)[themes],
+                               ID_COL: answers[ID_COL].to_numpy()[rows], "count": hits[rows, themes]})
+
+    index = pd.concat([theme_rows, tokens], ignore_index=True)
+    index = index.sort_values(["kind", "term", ID_COL], ignore_index=True)
+    return index.astype({"kind": "category", "term": "category", ID_COL: "int64", "count": "int32"})
+
+def save(df_clean, df_long, path=OUTPUT_PATH, parquet_path=PARQUET_PATH,
+         long_path=MULTI_CHOICE_PATH, long_parquet_path=MULTI_CHOICE_PARQUET_PATH, cache=None):
+    """Write the processed files; with a StageCache, files already holding this output are left untouched.
+
+    Returns whether the files were written."""
+    outputs = [path, parquet_path, long_path, long_parquet_path, CUBE_PATH, TEXT_INDEX_PATH]
+    if cache is not None:
+        key = stage_key("save", [df_clean, df_long, *outputs, *SAVE_STAGE_CODE])
+        if cache.load(key) == {p: file_sha256(p) if os.path.exists(p) else None for p in outputs}:
+            print("Processed files already up to date.")
+            return False
+
+    with RUN_REPORT.stage("save") as out:
+        df_clean.to_csv(path, index=False)
+        df_typed = to_categorical(df_clean)
+        df_typed.to_parquet(parquet_path, index=False)
+        df_long.to_csv(long_path, index=False)
+        multi_choice_to_categorical(df_long).to_parquet(long_parquet_path, index=False)
+        out["shape"] = df_clean.shape
+    with RUN_REPORT.stage("segment_cube") as out:
+        # Built from the typed frame, like the incremental and streaming runs do
+        cube = segment_cube(df_typed)
+        cube.to_parquet(CUBE_PATH, index=False)
+        out["shape"] = cube.shape
+    with RUN_REPORT.stage("text_index") as out:
+        index = text_index(df_clean)
+        index.to_parquet(TEXT_INDEX_PATH, index=False)
+        out["shape"] = index.shape
+
+    if cache is not None:
+        cache.store(key, {p: file_sha256(p) for p in outputs})
+    return True
+
+def append(df_clean, path=OUTPUT_PATH):
+    """Append cleaned rows to an existing processed file, keeping its column order.
+
+    Returns False (and writes nothing) when the file is missing or its schema changed,
+    so the caller can rebuild instead."""
+    if not os.path.exists(path):
+        return False
+    columns = pd.read_csv(path, nrows=0).columns
+    if set(columns) != set(df_clean.columns):
+        return False
+    df_clean[columns].to_csv(path, mode="a", header=False, index=False)
+    return True
+
+def refresh_parquet(df_new, path=OUTPUT_PATH, parquet_path=PARQUET_PATH, typed=to_categorical):
+    """Rewrite a Parquet file after an append to its CSV (Parquet files cannot be appended to)."""
+    if os.path.exists(parquet_path):
+        df_full = pd.concat([pd.read_parquet(parquet_path), df_new], ignore_index=True)
+    else:
+        df_full = pd.read_csv(path)
+    typed(df_full).to_parquet(parquet_path, index=False)
+
+def csv_to_parquet(path, parquet_path, typed, chunksize):
+    """Write a processed CSV to Parquet one row group per chunk, with the dtypes applied by typed."""
+    writer = None
+    # Every answer is a string: keep literal "None" answers and do not infer other types
+    chunks = pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False, na_values=[""])
+    try:
+        for chunk in chunks:
+            chunk[ID_COL] = chunk[ID_COL].astype("int64")
+            table = pa.Table.from_pandas(typed(chunk), preserve_index=False,
+                                         schema=None if writer is None else writer.schema)
+            if writer is None:
+                writer = pq.ParquetWriter(parquet_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def save_chunks(cleaned_chunks, chunksize, path=OUTPUT_PATH, parquet_path=PARQUET_PATH,
+                long_path=MULTI_CHOICE_PATH, long_parquet_path=MULTI_CHOICE_PARQUET_PATH):
+    """Streaming counterpart of save(): takes (df_clean, df_long) chunks and keeps only one in memory.
+
+    Chunks are appended to the CSV files while their categories are collected; the Parquet
+    files are then written from the CSVs, chunk by chunk, and the segment cube is built from
+    the dictionary-encoded segment columns only."""
+    observed = {}
+    long_observed = {"question": set(), "value": set()}
+    columns = None
+    for i, (df_clean, df_long) in enumerate(cleaned_chunks):
+        with RUN_REPORT.stage("save") as out:
+            if columns is None:
+                columns = df_clean.columns
+            df_clean[columns].to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            df_long.to_csv(long_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            observe_categories(df_clean, observed)
+            for col, values in long_observed.items():
+                values.update(df_long[col].dropna())
+            out["shape"] = df_clean.shape
+    if columns is None:
+        return
+
+    with RUN_REPORT.stage("save: parquet"):
+        dtypes = categorical_dtypes(columns, observed)
+        csv_to_parquet(path, parquet_path, lambda chunk: to_categorical(chunk, dtypes), chunksize)
+        long_dtypes = multi_choice_dtypes(long_observed)
+        csv_to_parquet(long_path, long_parquet_path,
+                       lambda chunk: multi_choice_to_categorical(chunk, long_dtypes), chunksize)
+    with RUN_REPORT.stage("segment_cube") as out:
+        df_segments = pd.read_parquet(parquet_path, columns=SEGMENT_COLS)
+        cube = segment_cube(df_segments)
+        cube.to_parquet(CUBE_PATH, index=False)
+        out["shape"] = cube.shape
+    with RUN_REPORT.stage("text_index") as out:
+        index = text_index(pd.read_parquet(parquet_path, columns=[ID_COL, TEXT_COL]))
+        index.to_parquet(TEXT_INDEX_PATH, index=False)
+        out["shape"] = index.shape
+
+SAVE_STAGE_CODE = (save, to_categorical, categorical_dtypes, observe_categories, multi_choice_to_categorical,
+                   multi_choice_dtypes, segment_cube, CATEGORY_ORDERS, NUMERIC_DTYPES, SEGMENT_COLS,
+                   text_index, trie_regex, KeywordMatcher, TEXT_THEMES, TOKEN_PATTERN, map_unique, normalize_text,
+                   NORMALIZE_TABLE)
+
+# Everything that shapes the processed files of a given export: cleaning steps, mappings and save
+CLEANING_CODE = (clean, RENAME_COLUMNS, clean_multi_choice, MULTI_CHOICE_COLS, *MULTI_CHOICE_STAGE_CODE,
+                 clean_columns, clean_age, COLUMN_MAPPINGS, drop_raw_columns, score_interests, LIKERT_SCORES,
+                 INTEREST_SCORES, *SAVE_STAGE_CODE)
+
+def code_fingerprint():
+    """SHA-256 of CLEANING_CODE, which changes with any mapping or cleaning code edit."""
+    return stage_key("cleaning code", CLEANING_CODE)
+
+def clean_chunks(chunks, unmapped=None, first_id=0, cache=None):
+    """Clean raw chunks one at a time, numbering respondents across chunks."""
+    for chunk in chunks:
+        yield clean(chunk, unmapped, first_id, cache)
+        first_id += len(chunk)
+
+def clean_part(df, first_id, cache=None):
+    """clean() as run by a worker process.
+
+    Returns the tables with what the parent process cannot see: the worker's unmapped
+    answers, cache hits and misses and stage timings."""
+    unmapped = {}
+    RUN_REPORT.reset()  # worker processes are reused from one chunk to the next
+    df_clean, df_long = clean(df, unmapped, first_id, cache)
+    hits = (0, 0) if cache is None else (cache.hits, cache.misses)
+    return df_clean, df_long, unmapped, hits, RUN_REPORT.stages
+
+def merge_unmapped(unmapped, part):
+    for col, counts in part.items():
+        report = unmapped.setdefault(col, {})
+        for value, n in counts.items():
+            report[value] = report.get(value, 0) + n
+
+def clean_chunks_parallel(chunks, workers, unmapped=None, first_id=0, cache=None):
+    """clean_chunks() spreading the chunks over a pool of worker processes.
+
+    Results come back in input order; at most 2 * workers chunks are in flight, so a
+    chunked read keeps its memory bound."""
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+
+        def result():
+            df_clean, df_long, part, (hits, misses), stages = pending.popleft().result()
+            RUN_REPORT.merge(stages)
+            if unmapped is not None:
+                merge_unmapped(unmapped, part)
+            if cache is not None:
+                cache.hits += hits
+                cache.misses += misses
+            return df_clean, df_long
+
+        for chunk in chunks:
+            # Each worker gets a copy of cache, with its counters at 0
+            pending.append(pool.submit(clean_part, chunk, first_id, cache and StageCache(cache.path, cache.max_bytes)))
+            first_id += len(chunk)
+            if len(pending) >= 2 * workers:
+                yield result()
+        while pending:
+            yield result()
+
+def clean_parallel(df, workers, unmapped=None, first_id=0, cache=None):
+    """clean() with the rows split in one shard per worker (serial when workers <= 1)."""
+    if workers <= 1 or len(df) < 2:
+        return clean(df, unmapped, first_id, cache)
+    size = -(-len(df) // workers)
+    shards = (df.iloc[start:start + size] for start in range(0, len(df), size))
+    parts = list(clean_chunks_parallel(shards, workers, unmapped, first_id, cache))
+    return (pd.concat([df_clean for df_clean, _ in parts]),
+            pd.concat([df_long for _, df_long in parts], ignore_index=True))
+
+def print_unmapped(unmapped, limit=10):
+    """List the answers no mapping knows, most frequent first, so the dicts of column_mappings.json can be extended."""
+    for col, counts in unmapped.items():
+        top = sorted(counts.items(), key=lambda kv: -kv[1])[:limit]
+        print(f"Unmapped answers in {col}: {len(counts)} distinct, {sum(counts.values())} rows")
+        for value, n in top:
+            print(f"    {n:>6}  {value!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch, clean and export the Japan travel survey.")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"only clean rows not in {OUTPUT_PATH} yet (from its latest {TIMESTAMP_COL} on) "
+                             "and append them")
+    parser.add_argument("--chunksize", type=int, default=None, metavar="N",
+                        help="read and clean the export N rows at a time to bound memory use")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="clean the rows in N worker processes (same output as a serial run)")
+    parser.add_argument("--force", action="store_true",
+                        help="clean the export even if neither it nor the cleaning code changed since the last run")
+    parser.add_argument("--url", default=url, help="address of the CSV export (defaults to the survey sheet)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"recompute every stage instead of reusing the results kept in {STAGE_CACHE_DIR}")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile the cleaning into FILE: pyinstrument HTML for a .html name (if installed), "
+                             "cProfile stats otherwise (worker processes are not profiled)")
+    args = parser.parse_args(argv)
+
+    RUN_REPORT.reset()
+    with RUN_REPORT.stage("fetch"):
+        meta = fetch_raw(args.url)
+    code = code_fingerprint()
+    data_changed = meta["sha256"] != meta.get("processed_sha256")
+    code_changed = code != meta.get("processed_code")
+    if not args.force and not data_changed and not code_changed:
+        print("Raw export and cleaning code unchanged since the last run, nothing to do.")
+        return
+    if not data_changed and code_changed:
+        print("Cleaning code or mappings changed since the last run, cleaning the export again.")
+    with profiled(args.profile):
+        info = run(args, RAW_SNAPSHOT_PATH, code_changed)
+    meta["processed_sha256"] = meta["sha256"]
+    meta["processed_code"] = code
+    write_raw_meta(meta)
+    # Only runs that wrote the processed files get a report, so that idle runs commit nothing
+    if info["outcome"] in ("rebuilt", "appended"):
+        RUN_REPORT.write(**info, incremental=args.incremental, chunksize=args.chunksize, workers=args.workers)
+        print(f"Run report written to {RUN_REPORT_PATH}.")
+
+@contextlib.contextmanager
+def profiled(path):
+    """Profile the body into path: pyinstrument HTML for a .html path, cProfile stats otherwise."""
+    if path is None:
+        yield
+        return
+    if path.endswith(".html"):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise SystemExit("An HTML profile needs pyinstrument (pip install pyinstrument).")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, "w") as f:
+                f.write(profiler.output_html())
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+
+def run(args, source, code_changed=False):
+    """Clean the export at source into the processed files, as asked by the command line args.
+
+    code_changed forces a full rebuild: rows appended by the new code would not match the
+    ones already processed. Returns the outcome of the run and the stage cache hits, for the
+    run report."""
+    cache = None if args.no_cache else StageCache()
+    try:
+        outcome = update(args, source, cache, code_changed)
+    finally:
+        if cache is not None:
+            print(f"Stage cache: {cache.hits} hits, {cache.misses} misses.")
+            cache.prune()
+    if cache is None:
+        return {"outcome": outcome}
+    return {"outcome": outcome, "cache_hits": cache.hits, "cache_misses": cache.misses}
+
+def update(args, source, cache, code_changed=False):
+    if args.incremental and code_changed:
+        if os.path.exists(OUTPUT_PATH):
+            print("Cleaning code or mappings changed since the processed files were written, rebuilding from scratch.")
+    elif args.incremental:
+        high_water_mark = read_high_water_mark()
+        if high_water_mark is not None:
+            seen = read_processed_counts(high_water_mark)
+            if args.chunksize:
+                # Only the new rows are kept, so they fit in one frame
+                chunks = [select_new_rows(chunk, high_water_mark, seen)
+                          for chunk in load_raw(source, args.chunksize)]
+                df_new = pd.concat(chunks, ignore_index=True)
+            else:
+                df_new = select_new_rows(load_raw(source), high_water_mark, seen)
+            if df_new.empty:
+                print(f"No responses since {high_water_mark}, nothing to do.")
+                return "no new rows"
+            unparsed = RUN_REPORT.counts.get("new rows without timestamp", 0)
+            if unparsed:
+                print(f"Warning: {unparsed} new responses have no parsable {TIMESTAMP_COL}, appended anyway.")
+            unmapped = {}
+            df_new_clean, df_new_long = clean_parallel(df_new, args.workers, unmapped,
+                                                       read_next_respondent_id(), cache)
+            print_unmapped(unmapped)
+            with RUN_REPORT.stage("append") as out:
+                appended = append(df_new_clean) and append(df_new_long, MULTI_CHOICE_PATH)
+                out["shape"] = df_new_clean.shape
+            if appended:
+                with RUN_REPORT.stage("save: parquet"):
+                    refresh_parquet(df_new_clean)
+                    refresh_parquet(df_new_long, MULTI_CHOICE_PATH, MULTI_CHOICE_PARQUET_PATH,
+                                    typed=multi_choice_to_categorical)
+                df_full = pd.read_parquet(PARQUET_PATH)
+                with RUN_REPORT.stage("segment_cube") as out:
+                    cube = segment_cube(df_full)
+                    cube.to_parquet(CUBE_PATH, index=False)
+                    out["shape"] = cube.shape
+                with RUN_REPORT.stage("text_index") as out:
+                    index = text_index(df_full)
+                    index.to_parquet(TEXT_INDEX_PATH, index=False)
+                    out["shape"] = index.shape
+                print(f"Appended {len(df_new)} responses since {high_water_mark}.")
+                return "appended"
+            print("Processed file schema changed, rebuilding from scratch.")
+
+    unmapped = {}
+    if args.chunksize:
+        chunks = load_raw(source, args.chunksize)
+        if args.workers > 1:
+            cleaned = clean_chunks_parallel(chunks, args.workers, unmapped, cache=cache)
+        else:
+            cleaned = clean_chunks(chunks, unmapped, cache=cache)
+        save_chunks(cleaned, args.chunksize)
+        written = True
+    else:
+        written = save(*clean_parallel(load_raw(source), args.workers, unmapped, cache=cache), cache=cache)
+    print_unmapped(unmapped)
+    return "rebuilt" if written else "up to date"
 
 
-# 10. Save CSV file
-df_clean.to_csv("data_processed/df_clean.csv", index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
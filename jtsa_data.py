@@ -0,0 +1,806 @@
+"""Data layer for the Streamlit dashboard (JTSA_app.py).
+
+Streamlit re-executes JTSA_app.py on every interaction, but imported modules stay
+in memory, so the prepared dataset is cached here once per process and shared
+by every session. Nothing in this module calls Streamlit.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from clean_import import (
+    CATEGORY_ORDERS,
+    CUBE_PATH,
+    FILTER_COLS,
+    MULTI_CHOICE_PARQUET_PATH,
+    MULTI_CHOICE_PATH,
+    OUTPUT_PATH,
+    PARQUET_PATH,
+    TEXT_COL,
+    TEXT_INDEX_PATH,
+    TEXT_THEMES,
+    TOKEN_PATTERN,
+    multi_choice_to_categorical,
+    normalize_text,
+    to_categorical,
+)
+
+logger = logging.getLogger(__name__)
+
+DATA_PATH = OUTPUT_PATH
+
+# -----------------------------------------------------------
+# Reading
+# -----------------------------------------------------------
+
+def default_data_path() -> str:
+    """Prefer the typed Parquet export of the cleaner, fall back to the CSV."""
+    return PARQUET_PATH if os.path.exists(PARQUET_PATH) else DATA_PATH
+
+
+def default_multi_choice_path() -> str:
+    return MULTI_CHOICE_PARQUET_PATH if os.path.exists(MULTI_CHOICE_PARQUET_PATH) else MULTI_CHOICE_PATH
+
+
+# One CategoricalDtype per value domain (categories and order), shared by every
+# column, table and reload holding it; a domain is dropped once no frame uses it
+DICTIONARIES = weakref.WeakValueDictionary()
+_dictionaries_lock = threading.Lock()
+
+
+def shared_dtype(dtype: pd.CategoricalDtype) -> pd.CategoricalDtype:
+    """The registered dtype with the categories and order of dtype (dtype itself if new)."""
+    key = (tuple(dtype.categories), dtype.ordered)
+    with _dictionaries_lock:
+        shared = DICTIONARIES.get(key)
+        if shared is None:
+            DICTIONARIES[key] = shared = dtype
+    return shared
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Store the categorical columns as codes over the shared dictionaries, ids as int32 when they fit.
+
+    pandas keeps the codes in the narrowest signed type (int8 up to 127
+    categories, int16 beyond); the codes are reused as they are, only the
+    dictionary they point to is swapped. Labels are only decoded when a chart
+    or a table asks for them.
+    """
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            shared = shared_dtype(dtype)
+            if shared is not dtype:
+                codes = df[col].cat.codes.to_numpy()
+                df[col] = pd.Categorical.from_codes(codes, dtype=shared, validate=False)
+    ids = df.get("respondent_id")
+    if ids is not None and ids.dtype == np.int64 and (ids.empty or ids.max() <= np.iinfo(np.int32).max):
+        df["respondent_id"] = ids.astype(np.int32)
+    return df
+
+
+def read_dataset(path: str = DATA_PATH) -> pd.DataFrame:
+    """Read the processed data.
+
+    Answer columns come back as categoricals either way: Parquet stores them
+    dictionary-encoded, a CSV gets the same dtypes applied after parsing. The
+    ratings (Int8 scores) and the interest scores (float32) are computed by
+    clean_import.py, nothing is derived here. The categories are then shared
+    with the rest of the process (see compact()).
+    """
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+    else:
+        df = to_categorical(pd.read_csv(path))
+    df = compact(df)
+
+    df.attrs["category_orders"] = CATEGORY_ORDERS
+
+    return df
+
+
+def read_multi_choice(path: str = MULTI_CHOICE_PATH) -> pd.DataFrame:
+    """Read the long (respondent_id, question, rank, value) table of the multi-choice answers."""
+    if path.endswith(".parquet"):
+        return compact(pd.read_parquet(path))
+    return compact(multi_choice_to_categorical(pd.read_csv(path)))
+
+
+class TextIndex:
+    """Inverted index of the free-text answers, as written by clean_import.text_index().
+
+    The respondents of a token or a theme are a slice of one sorted array, so a
+    lookup costs a dict access; intersections with a filtered view are np.isin.
+    """
+
+    def __init__(self, index: pd.DataFrame):
+        self.ids = index["respondent_id"].to_numpy()
+        self.counts = index["count"].to_numpy()
+        # Rows are sorted by (kind, term): the rows of a term are one [start, end) slice
+        sizes = index.groupby(["kind", "term"], observed=True, sort=False).size()
+        ends = np.cumsum(sizes.to_numpy())
+        self.slices = {key: slice(end - size, end) for key, size, end in zip(sizes.index, sizes.to_numpy(), ends)}
+        self.themes = list(TEXT_THEMES)
+
+    def respondents(self, kind: str, term: str) -> np.ndarray:
+        """Sorted respondent ids with at least one hit of a token or theme (empty if unknown)."""
+        return self.ids[self.slices.get((kind, term), slice(0, 0))]
+
+    def search(self, keywords: str) -> np.ndarray:
+        """Respondents whose answer holds every word of keywords (normalized like the answers)."""
+        tokens = re.findall(TOKEN_PATTERN, normalize_text(keywords) or "")
+        if not tokens:
+            return self.ids[:0]
+        result = self.respondents("token", tokens[0])
+        for token in tokens[1:]:
+            result = np.intersect1d(result, self.respondents("token", token), assume_unique=True)
+        return result
+
+    def select(self, theme: str = None, keywords: str = ""):
+        """Respondents matching theme and every word of keywords, or None when neither is given."""
+        ids = None if theme is None else self.respondents("theme", theme)
+        if keywords and keywords.strip():
+            found = self.search(keywords)
+            ids = found if ids is None else np.intersect1d(ids, found, assume_unique=True)
+        return ids
+
+    def theme_counts(self, respondent_ids=None) -> pd.DataFrame:
+        """Keyword hits and answers per theme, over respondent_ids (None for every respondent)."""
+        rows = []
+        for theme in self.themes:
+            part = self.slices.get(("theme", theme), slice(0, 0))
+            ids, counts = self.ids[part], self.counts[part]
+            if respondent_ids is not None:
+                keep = np.isin(ids, respondent_ids)
+                ids, counts = ids[keep], counts[keep]
+            rows.append({"theme": theme, "count": int(counts.sum()), "answers": len(ids)})
+        return pd.DataFrame(rows, columns=["theme", "count", "answers"])
+
+
+def read_text_index(path: str = TEXT_INDEX_PATH) -> TextIndex:
+    return TextIndex(pd.read_parquet(path))
+
+
+def read_segment_cube(path: str = CUBE_PATH) -> dict:
+    """Read the segment count cube, split into one frame per (dim_a, dim_b) pair."""
+    cube = pd.read_parquet(path)
+    return {
+        pair: rows.drop(columns=["dim_a", "dim_b"]).reset_index(drop=True)
+        for pair, rows in cube.groupby(["dim_a", "dim_b"], observed=True)
+    }
+
+
+# -----------------------------------------------------------
+# Process-wide cache
+# -----------------------------------------------------------
+
+# path -> {"signature": (mtime_ns, size), "sha256": str, "df": DataFrame}
+_cache = {}
+_cache_lock = threading.Lock()
+
+LOAD_STATS = {
+    "hits": 0,
+    "misses": 0,
+    "last_hit": None,
+    "last_seconds": None,
+    "hit_seconds": 0.0,
+    "miss_seconds": 0.0,
+}
+
+
+def file_signature(path: str) -> tuple:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_data(path: str = None) -> pd.DataFrame:
+    """Return the prepared dataset, re-reading the file only when it changed.
+
+    The file's mtime and size are checked on every call; when they moved, the
+    content hash decides whether the file really changed (the scheduled
+    workflow often rewrites an identical CSV). The returned frame is shared
+    between sessions and must not be modified in place.
+    """
+    if path is None:
+        path = default_data_path()
+    return load_cached(path, read_dataset)
+
+
+def load_multi_choice(path: str = None) -> pd.DataFrame:
+    """Return the long multi-choice table, cached like load_data()."""
+    if path is None:
+        path = default_multi_choice_path()
+    return load_cached(path, read_multi_choice)
+
+
+def data_version(df) -> str:
+    """Content hash of the file a cached dataset was read from (None if it is not cached)."""
+    with _cache_lock:
+        for entry in _cache.values():
+            if entry["df"] is df:
+                return entry["sha256"]
+    return None
+
+
+def load_segment_cube(path: str = CUBE_PATH) -> dict:
+    """Return the segment count cube ({(dim_a, dim_b): counts}), cached like load_data()."""
+    return load_cached(path, read_segment_cube)
+
+
+def load_text_index(path: str = TEXT_INDEX_PATH) -> TextIndex:
+    """Return the text index of the free-text answers, cached like load_data()."""
+    return load_cached(path, read_text_index)
+
+
+def load_cached(path: str, reader) -> pd.DataFrame:
+    """Return reader(path), reusing the cached frame while the file is unchanged."""
+    start = time.perf_counter()
+    signature = file_signature(path)
+
+    # Loading under the lock means concurrent sessions wait for a single read
+    # instead of each parsing the same file.
+    with _cache_lock:
+        entry = _cache.get(path)
+        hit = entry is not None and entry["signature"] == signature
+        if entry is not None and not hit:
+            sha256 = file_sha256(path)
+            if sha256 == entry["sha256"]:
+                entry["signature"] = signature
+                hit = True
+        if not hit:
+            df = reader(path)
+            entry = {"signature": signature, "sha256": file_sha256(path), "df": df}
+            _cache[path] = entry
+
+    elapsed = time.perf_counter() - start
+    LOAD_STATS["hits" if hit else "misses"] += 1
+    LOAD_STATS["hit_seconds" if hit else "miss_seconds"] += elapsed
+    LOAD_STATS["last_hit"] = hit
+    LOAD_STATS["last_seconds"] = elapsed
+    logger.info(
+        "load(%s): cache %s in %.1f ms", path, "hit" if hit else "miss", elapsed * 1000
+    )
+
+    return entry["df"]
+
+
+# -----------------------------------------------------------
+# Sidebar filter index
+# -----------------------------------------------------------
+
+class FilterIndex:
+    """Bitmap index over the sidebar filter columns of a dataset.
+
+    Every observed value of a filter column gets a packed bitset (one bit per
+    row). A filter selection is resolved with bitwise ORs within a column and
+    ANDs across columns, without touching the frame itself.
+    """
+
+    def __init__(self, df: pd.DataFrame, columns=FILTER_COLS):
+        self.n_rows = len(df)
+        self.bitmaps = {}
+        for col in columns:
+            codes, uniques = pd.factorize(df[col])
+            self.bitmaps[col] = {
+                value: np.packbits(codes == i) for i, value in enumerate(uniques)
+            }
+
+    def values(self, col: str) -> list:
+        """Values of col present in the dataset (missing values excluded)."""
+        return list(self.bitmaps[col])
+
+    def mask(self, selections: dict) -> np.ndarray:
+        """Boolean row mask for {column: selected values}; empty selections do not filter."""
+        bits = np.full((self.n_rows + 7) // 8, 0xFF, dtype=np.uint8)
+        for col, selected in selections.items():
+            if not selected:
+                continue
+            col_bits = np.zeros_like(bits)
+            for value in selected:
+                if value in self.bitmaps[col]:
+                    col_bits |= self.bitmaps[col][value]
+            bits &= col_bits
+        return np.unpackbits(bits, count=self.n_rows).astype(bool)
+
+
+# id(df) -> FilterIndex, dropped when the dataset itself is garbage collected
+_filter_indexes = {}
+
+
+def filter_index(df: pd.DataFrame) -> FilterIndex:
+    """Return the FilterIndex of a dataset returned by load_data(), built on first use."""
+    with _cache_lock:
+        index = _filter_indexes.get(id(df))
+        if index is None:
+            index = FilterIndex(df)
+            _filter_indexes[id(df)] = index
+            weakref.finalize(df, _filter_indexes.pop, id(df), None)
+    return index
+
+
+# -----------------------------------------------------------
+# Segment crosstabs
+# -----------------------------------------------------------
+
+def cube_crosstab(cube: dict, df: pd.DataFrame, group_col: str, target_col: str, selections: dict):
+    """Respondent counts per (group_col, target_col) over every respondent, read from the cube.
+
+    Same result as df.groupby([group_col, target_col], observed=True).size(), with the
+    columns typed like df. Returns None when a sidebar filter is set or the cube does not
+    hold the pair: the caller then groups the filtered rows.
+    """
+    if canonical_filters(selections):
+        return None
+    if (group_col, target_col) in cube:
+        rows, group_values, target_values = cube[(group_col, target_col)], "value_a", "value_b"
+    elif (target_col, group_col) in cube:
+        rows, group_values, target_values = cube[(target_col, group_col)], "value_b", "value_a"
+    else:
+        return None
+
+    # One row per observed pair already: recode to df's categories and sort like a groupby
+    ctab = pd.DataFrame(
+        {
+            group_col: pd.Categorical(rows[group_values], dtype=df[group_col].dtype),
+            target_col: pd.Categorical(rows[target_values], dtype=df[target_col].dtype),
+            "count": rows["count"].astype("int64"),
+        }
+    )
+    return ctab.dropna(subset=[group_col, target_col]).sort_values([group_col, target_col], ignore_index=True)
+
+
+# -----------------------------------------------------------
+# Custom funnel
+# -----------------------------------------------------------
+
+TOP_VALUE = "[Top value]"
+
+
+def value_codes(values: pd.Series):
+    """Integer codes (-1 for missing) and the values they stand for, in category order for categoricals."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes, uniques
+
+
+def funnel_steps(df: pd.DataFrame, steps: dict, segment_by: str = None, cache_key=None) -> pd.DataFrame:
+    """Survivors of every funnel step, for every segment at once.
+
+    steps maps each column, in funnel order, to the value respondents must
+    have, or to TOP_VALUE for the most common value among the respondents
+    still in the funnel of each segment (ties go to the first value in
+    category order). Returns one row per (segment, step) with the value kept,
+    the remaining respondents and the conversion rate since the start.
+
+    Columns are read as integer codes and each step counts every
+    (segment, value) pair with one bincount over the surviving rows, so the
+    cost does not grow with the number of segments.
+
+    With a cache_key identifying df (dataset version and sidebar filters), the
+    surviving rows after every step prefix are kept in FUNNEL_CACHE and the
+    funnel resumes from its longest cached prefix: changing or adding the last
+    steps only computes those steps.
+    """
+    if segment_by is None:
+        seg_codes, segments = np.zeros(len(df), dtype=np.int64), [None]
+    else:
+        seg_codes, segments = value_codes(df[segment_by])
+    n_segments = len(segments)
+
+    steps = list(steps.items())
+    done, state = 0, None
+    if cache_key is not None:
+        for n in range(len(steps), 0, -1):
+            # One lookup per call in the stats: a hit on any prefix, a miss when none is cached
+            state = FUNNEL_CACHE.get((cache_key, segment_by, tuple(steps[:n])), count_miss=n == 1)
+            if state is not None:
+                done = n
+                break
+
+    if state is None:
+        rows = np.flatnonzero(seg_codes >= 0)  # rows still in the funnel
+        row_segs = seg_codes[rows].astype(np.int64)
+        start = np.bincount(row_segs, minlength=n_segments)
+        kept_values, remaining = [], []
+    else:
+        rows, row_segs, start, kept_values, remaining = state
+        kept_values, remaining = list(kept_values), list(remaining)
+
+    for n, (step, choice) in enumerate(steps[done:], start=done + 1):
+        codes, values = value_codes(df[step])
+        n_values = len(values)
+        step_codes = codes[rows].astype(np.int64)
+        answered = step_codes >= 0
+        counts = np.bincount(
+            row_segs[answered] * n_values + step_codes[answered], minlength=n_segments * n_values
+        ).reshape(n_segments, n_values)
+
+        if choice == TOP_VALUE:
+            kept = counts.argmax(axis=1) if n_values else np.zeros(n_segments, dtype=np.int64)
+            kept[counts.sum(axis=1) == 0] = -1
+        else:
+            matches = np.flatnonzero(np.asarray(values == choice))
+            kept = np.full(n_segments, matches[0] if len(matches) else -1)
+
+        keep = answered & (step_codes == kept[row_segs])
+        rows, row_segs = rows[keep], row_segs[keep]
+        kept_values.append([values[k] if k >= 0 else None for k in kept])
+        remaining.append(np.bincount(row_segs, minlength=n_segments))
+        if cache_key is not None:
+            state = (rows, row_segs, start, tuple(kept_values), tuple(remaining))
+            FUNNEL_CACHE.put((cache_key, segment_by, tuple(steps[:n])), state)
+
+    records = [
+        {
+            "segment": segments[seg],
+            "start": int(start[seg]),
+            "step": step,
+            "value": kept_values[i][seg],
+            "remaining": int(remaining[i][seg]),
+            "conversion_rate": remaining[i][seg] / start[seg] * 100 if start[seg] else 0,
+        }
+        for seg in range(n_segments)
+        for i, (step, _) in enumerate(steps)
+    ]
+    columns = ["segment", "start", "step", "value", "remaining", "conversion_rate"]
+    result = pd.DataFrame(records, columns=columns)
+    if segment_by is None:
+        return result.drop(columns="segment")
+    return result.rename(columns={"segment": segment_by})
+
+
+# -----------------------------------------------------------
+# Figure cache
+# -----------------------------------------------------------
+
+def canonical_filters(selections: dict) -> tuple:
+    """Hashable, order-independent form of the sidebar selections (empty ones dropped)."""
+    return tuple(
+        (col, tuple(sorted(map(str, selected))))
+        for col, selected in sorted(selections.items())
+        if selected
+    )
+
+
+def _plotly_value_size(value) -> int:
+    """Rough memory of a value of a Plotly trace spec: array buffers, strings, 8 bytes per scalar."""
+    if isinstance(value, np.ndarray):
+        if value.dtype != object:
+            return value.nbytes
+        return sum(_plotly_value_size(v) for v in value)
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(k) + _plotly_value_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 8 + sum(_plotly_value_size(v) for v in value)
+    return 8
+
+
+def figure_size(fig) -> int:
+    """Approximate memory of a figure: the data of its traces, without serializing it.
+
+    Well under a millisecond where fig.to_json() takes several (payload_size()
+    is the exact figure sent to the browser, measured by the profiler only).
+    """
+    return 0 if fig is None else sum(_plotly_value_size(trace.to_plotly_json()) for trace in fig.data)
+
+
+def payload_size(fig) -> int:
+    """Bytes of the JSON spec of a figure, as sent to the browser."""
+    return 0 if fig is None else len(fig.to_json())
+
+
+class FigureCache:
+    """Process-wide LRU cache of built figures, capped in number and in bytes.
+
+    Keys are built by the caller and must include everything the figure
+    depends on (dataset version, canonical filters, column, options...).
+    Cached figures are shared between sessions and must not be modified.
+    With another sizeof it also holds other results (see FUNNEL_CACHE).
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024, sizeof=figure_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (figure, size)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+
+    def get(self, key, default=None, count_miss: bool = True):
+        """Return the cached value for key (counted as a hit), or default (counted as a miss).
+
+        count_miss=False is for probes that do not decide on a build by
+        themselves, such as the prefixes tried by funnel_steps().
+        """
+        with self._lock:
+            if key not in self._entries:
+                if count_miss:
+                    self.stats["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        """Store a value that was just built, evicting the oldest entries."""
+        size = self.sizeof(value)
+        with self._lock:
+            if size > self.max_bytes:
+                return
+            if key in self._entries:
+                self.stats["bytes"] -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.stats["bytes"] += size
+            while len(self._entries) > self.max_entries or self.stats["bytes"] > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.stats["bytes"] -= evicted_size
+                self.stats["evictions"] += 1
+
+    def get_or_build(self, key, build):
+        """Return the cached figure for key, or build(), store and return it."""
+        missing = object()
+        fig = self.get(key, missing)
+        if fig is missing:
+            # Built outside the lock: other sessions keep reading the cache meanwhile
+            fig = build()
+            self.put(key, fig)
+        return fig
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+FIGURE_CACHE = FigureCache()
+
+
+def funnel_state_size(state) -> int:
+    """Memory of a cached funnel prefix: its row arrays and per-step results."""
+    rows, row_segs, start, kept_values, remaining = state
+    small = sum(r.nbytes + 64 * len(k) for k, r in zip(kept_values, remaining))
+    return rows.nbytes + row_segs.nbytes + start.nbytes + small
+
+
+# (dataset version, filters, segment_by, step prefix) -> surviving rows after that prefix
+FUNNEL_CACHE = FigureCache(max_entries=256, max_bytes=256 * 1024 * 1024, sizeof=funnel_state_size)
+
+
+def frame_size(df: pd.DataFrame) -> int:
+    """Memory of a cached frame (arrow-backed strings report their buffers without deep=True)."""
+    return int(df.memory_usage().sum())
+
+
+# (dataset version, filters) -> filtered rows, shared by every session with those filters
+FILTER_CACHE = FigureCache(max_entries=32, max_bytes=256 * 1024 * 1024, sizeof=frame_size)
+
+
+def filtered_rows(df: pd.DataFrame, selections: dict) -> pd.DataFrame:
+    """Rows of a dataset returned by load_data() matching the sidebar selections.
+
+    df itself is returned when nothing is filtered out. Otherwise the rows are
+    taken once per (dataset version, filters) and every session with the same
+    selections reads the same frame, so memory follows the distinct filter
+    states instead of the number of sessions. Under pandas' copy-on-write
+    (pandas 3) a session modifying the frame only modifies its own copy.
+    """
+    filters = canonical_filters(selections)
+    version = data_version(df)
+
+    def take():
+        mask = filter_index(df).mask(selections)
+        return df if mask.all() else df[mask]
+
+    if not filters:
+        return df
+    if version is None:
+        return take()
+    return FILTER_CACHE.get_or_build((version, filters), take)
+
+
+# -----------------------------------------------------------
+# Raw data pages & export
+# -----------------------------------------------------------
+
+# (dataset version, filters, column, ascending) -> row positions in that order
+SORT_CACHE = FigureCache(max_entries=64, max_bytes=128 * 1024 * 1024, sizeof=lambda order: order.nbytes)
+
+EXPORT_CHUNK_ROWS = 50_000
+
+
+def sort_order(df: pd.DataFrame, col: str, ascending: bool = True, cache_key=None) -> np.ndarray:
+    """Row positions of df sorted by col (category order for categoricals, missing values last).
+
+    The sort is stable. With a cache_key identifying df (dataset version and
+    sidebar filters) the order is kept in SORT_CACHE, so turning pages does not sort again.
+    """
+    key = None if cache_key is None else (cache_key, col, ascending)
+    order = None if key is None else SORT_CACHE.get(key)
+    if order is None:
+        codes, uniques = pd.factorize(df[col], sort=True)
+        if not ascending:
+            codes = np.where(codes >= 0, len(uniques) - 1 - codes, codes)
+        codes = np.where(codes >= 0, codes, len(uniques))
+        order = np.argsort(codes, kind="stable")
+        if key is not None:
+            SORT_CACHE.put(key, order)
+    return order
+
+
+def page_window(df: pd.DataFrame, page: int, page_size: int, sort_col: str = None,
+                ascending: bool = True, cache_key=None) -> pd.DataFrame:
+    """Rows of page (from 1) of df, sorted by sort_col when given; only these rows are copied."""
+    start = (page - 1) * page_size
+    if sort_col is None:
+        return df.iloc[start:start + page_size]
+    return df.iloc[sort_order(df, sort_col, ascending, cache_key)[start:start + page_size]]
+
+
+def export_file(df: pd.DataFrame, fmt: str = "csv", chunk_rows: int = EXPORT_CHUNK_ROWS) -> bytes:
+    """Contents of df as a CSV or Parquet file, written EXPORT_CHUNK_ROWS rows at a time.
+
+    CSV is UTF-8 with a BOM (opens cleanly in Excel); Parquet keeps the dtypes
+    and gets one row group per chunk. Returned as bytes, the type Streamlit
+    expects from a deferred st.download_button callable.
+    """
+    out = io.BytesIO()
+    if fmt == "parquet":
+        writer = None
+        for start in range(0, max(len(df), 1), chunk_rows):
+            table = pa.Table.from_pandas(df.iloc[start:start + chunk_rows], preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema)
+            writer.write_table(table)
+        writer.close()
+    else:
+        out.write("\ufeff".encode("utf-8"))
+        for start in range(0, max(len(df), 1), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            out.write(chunk.to_csv(index=False, header=start == 0).encode("utf-8"))
+    return out.getvalue()
+
+
+# -----------------------------------------------------------
+# Render profiling
+# -----------------------------------------------------------
+
+PROFILE_ENV_VAR = "JTSA_PROFILE"
+
+
+def profiling_enabled(query_value: str = None) -> bool:
+    """True when the profiling panel is on: ?profile=1 in the URL or JTSA_PROFILE=1 for the process."""
+    values = (query_value, os.environ.get(PROFILE_ENV_VAR))
+    return any(str(v).strip().lower() in ("1", "true", "yes", "on") for v in values if v is not None)
+
+
+class RerunProfile:
+    """Timings of one rerun of the dashboard, phase by phase, and of the figures it sent.
+
+    lap(name) closes the phase running since the previous lap. Time spent
+    measuring figure sizes is left out of the phases.
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.figures = []
+        self._last = time.perf_counter()
+        self._excluded = 0.0
+
+    def lap(self, phase: str):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last - self._excluded
+        self._last = now
+        self._excluded = 0.0
+
+    def figure(self, name: str, build_seconds: float, render_seconds: float, cached: bool, fig=None):
+        """Record a figure sent to the browser; its payload size is measured when fig is given."""
+        start = time.perf_counter()
+        size = payload_size(fig) if fig is not None else None
+        self._excluded += time.perf_counter() - start
+        self.figures.append(
+            {
+                "figure": name,
+                "cached": cached,
+                "build_ms": build_seconds * 1000,
+                "render_ms": render_seconds * 1000,
+                "payload_kb": size / 1024 if size is not None else None,
+            }
+        )
+
+    def summary(self) -> dict:
+        """Milliseconds per phase, with the figure build and rendering split out of the page phase."""
+        phases = {name: seconds * 1000 for name, seconds in self.phases.items()}
+        build = sum(f["build_ms"] for f in self.figures)
+        render = sum(f["render_ms"] for f in self.figures)
+        if "page" in phases:
+            phases["page"] = max(phases.pop("page") - build - render, 0.0)
+        phases["figure build"] = build
+        phases["figure serialization"] = render
+        summary = {name + "_ms": ms for name, ms in phases.items()}
+        summary["total_ms"] = sum(phases.values())
+        summary["figures"] = len(self.figures)
+        summary["payload_kb"] = sum(f["payload_kb"] or 0.0 for f in self.figures)
+        return summary
+
+
+class RenderProfiler:
+    """Process-wide rolling history of rerun summaries, kept per page."""
+
+    def __init__(self, history: int = 200):
+        self.history_size = history
+        self._history = {}  # page -> deque of RerunProfile.summary()
+        self._lock = threading.Lock()
+
+    def record(self, page: str, rerun: RerunProfile) -> dict:
+        summary = rerun.summary()
+        with self._lock:
+            self._history.setdefault(page, deque(maxlen=self.history_size)).append(summary)
+        return summary
+
+    def history(self, page: str) -> pd.DataFrame:
+        """Summaries of the last reruns of page, oldest first."""
+        with self._lock:
+            return pd.DataFrame(list(self._history.get(page, ())))
+
+    def pages(self) -> pd.DataFrame:
+        """Rerun count and total time percentiles per page, slowest median first."""
+        with self._lock:
+            totals = {page: [s["total_ms"] for s in runs] for page, runs in self._history.items()}
+        rows = [
+            {
+                "page": page,
+                "reruns": len(values),
+                "median_ms": np.median(values),
+                "p95_ms": np.percentile(values, 95),
+                "max_ms": max(values),
+            }
+            for page, values in totals.items()
+        ]
+        columns = ["page", "reruns", "median_ms", "p95_ms", "max_ms"]
+        return pd.DataFrame(rows, columns=columns).sort_values("median_ms", ascending=False, ignore_index=True)
+
+
+RENDER_PROFILER = RenderProfiler()
+
+
+def cache_stats() -> pd.DataFrame:
+    """Lookups, hit rate, evictions and size of the process-wide caches (all sessions)."""
+    caches = {"figures": FIGURE_CACHE, "funnel prefixes": FUNNEL_CACHE, "filtered rows": FILTER_CACHE,
+              "sort orders": SORT_CACHE}
+    rows = [
+        {
+            "cache": name,
+            "entries": len(cache),
+            "hits": cache.stats["hits"],
+            "misses": cache.stats["misses"],
+            "hit_rate": cache.hit_rate(),
+            "evictions": cache.stats["evictions"],
+            "mb": cache.stats["bytes"] / 1024 / 1024,
+        }
+        for name, cache in caches.items()
+    ]
+    return pd.DataFrame(rows)
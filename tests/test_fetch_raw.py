@@ -0,0 +1,163 @@
+"""Fetching the raw export: conditional requests, retries, truncated bodies and skipped runs.
+
+    python -m pytest tests
+
+The export is served by a local http.server on a thread, answering each
+request with the next response queued by the test.
+"""
+import hashlib
+import http.client
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import clean_import
+
+EXPORT_V1 = b"Horodateur,nationality\n01/05/2025 10:00:00,French\n"
+EXPORT_V2 = EXPORT_V1 + b"02/05/2025 11:30:00,Japanese\n"
+LAST_MODIFIED = "Thu, 01 May 2025 10:00:00 GMT"
+
+
+class ExportHandler(BaseHTTPRequestHandler):
+    """Answers every GET with the next (status, headers, body) of server.responses."""
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        status, headers, body = self.server.responses.pop(0)
+        self.send_response(status)
+        headers = {"Content-Length": str(len(body)), **headers}
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def ok(body, etag):
+    return 200, {"ETag": etag, "Last-Modified": LAST_MODIFIED}, body
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ExportHandler)
+    server.requests, server.responses = [], []
+    server.url = f"http://127.0.0.1:{server.server_port}/export.csv"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(tmp_path, monkeypatch):
+    """Run in an empty directory, recording the backoff delays instead of waiting."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data_raw")
+    os.makedirs("data_processed")
+    delays = []
+    monkeypatch.setattr(clean_import.time, "sleep", delays.append)
+    return delays
+
+
+def read_snapshot():
+    with open(clean_import.RAW_SNAPSHOT_PATH, "rb") as f:
+        return f.read()
+
+
+def read_meta():
+    with open(clean_import.RAW_META_PATH) as f:
+        return json.load(f)
+
+
+def test_not_modified_keeps_snapshot(server, sleeps):
+    server.responses = [ok(EXPORT_V1, '"v1"'), (304, {}, b"")]
+
+    meta = clean_import.fetch_raw(server.url)
+    assert read_snapshot() == EXPORT_V1
+    assert meta["sha256"] == hashlib.sha256(EXPORT_V1).hexdigest()
+    assert meta["etag"] == '"v1"'
+    assert "If-None-Match" not in server.requests[0]
+
+    # Second fetch: conditional request, answered 304
+    assert clean_import.fetch_raw(server.url) == meta
+    assert server.requests[1]["If-None-Match"] == '"v1"'
+    assert server.requests[1]["If-Modified-Since"] == LAST_MODIFIED
+    assert read_snapshot() == EXPORT_V1
+    assert read_meta() == meta
+    assert sleeps == []
+
+
+def test_server_error_is_retried(server, sleeps):
+    server.responses = [(503, {}, b""), (500, {}, b""), ok(EXPORT_V1, '"v1"')]
+
+    meta = clean_import.fetch_raw(server.url)
+    assert len(server.requests) == 3
+    assert sleeps == [1, 2]
+    assert read_snapshot() == EXPORT_V1
+    assert meta["sha256"] == hashlib.sha256(EXPORT_V1).hexdigest()
+
+
+def test_client_error_is_not_retried(server, sleeps):
+    server.responses = [(404, {}, b"")]
+
+    with pytest.raises(clean_import.HTTPError):
+        clean_import.fetch_raw(server.url)
+    assert len(server.requests) == 1
+    assert sleeps == []
+
+
+def test_short_body_keeps_previous_snapshot(server, sleeps):
+    server.responses = [ok(EXPORT_V1, '"v1"')]
+    meta = clean_import.fetch_raw(server.url)
+
+    # The connection drops before the announced length on every attempt
+    short = (200, {"ETag": '"v2"', "Content-Length": str(len(EXPORT_V2))}, EXPORT_V2[:-10])
+    server.responses = [short] * clean_import.FETCH_RETRIES
+    with pytest.raises(http.client.IncompleteRead):
+        clean_import.fetch_raw(server.url)
+    assert len(server.requests) == 1 + clean_import.FETCH_RETRIES
+    assert read_snapshot() == EXPORT_V1
+    assert read_meta() == meta
+
+
+def test_main_skips_unchanged_export_unless_forced(server, sleeps, monkeypatch, capsys):
+    runs = []
+
+    def fake_run(args, source, code_changed=False):
+        runs.append(code_changed)
+        return {"outcome": "up to date"}
+
+    monkeypatch.setattr(clean_import, "run", fake_run)
+
+    server.responses = [ok(EXPORT_V1, '"v1"')]
+    clean_import.main(["--url", server.url])
+    assert runs == [True]  # no fingerprint stored yet
+    assert read_meta()["processed_sha256"] == hashlib.sha256(EXPORT_V1).hexdigest()
+    assert read_meta()["processed_code"] == clean_import.code_fingerprint()
+
+    server.responses = [(304, {}, b"")]
+    clean_import.main(["--url", server.url])
+    assert runs == [True]
+    assert "nothing to do" in capsys.readouterr().out
+
+    server.responses = [(304, {}, b"")]
+    clean_import.main(["--url", server.url, "--force"])
+    assert runs == [True, False]
+
+    server.responses = [ok(EXPORT_V2, '"v2"')]
+    clean_import.main(["--url", server.url])
+    assert runs == [True, False, False]
+    assert read_meta()["processed_sha256"] == hashlib.sha256(EXPORT_V2).hexdigest()
+
+    # Same export, new cleaning code: cleaned again
+    monkeypatch.setattr(clean_import, "code_fingerprint", lambda: "edited")
+    server.responses = [(304, {}, b"")]
+    clean_import.main(["--url", server.url])
+    assert runs == [True, False, False, True]
+    assert not os.path.exists(clean_import.RUN_REPORT_PATH)
@@ -0,0 +1,62 @@
+"""Raw Data page: both download buttons produce a file that reads back as the dataset.
+
+    python -m pytest tests
+
+The download data is a callable that Streamlit runs when the button is clicked
+(a request from the browser, not a rerun), so the test runs it the same way,
+through MediaFileManager.execute_deferred on the manager of the app run.
+"""
+import io
+import os
+from unittest import mock
+
+import pandas as pd
+import pytest
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READERS = {
+    "CSV": lambda data: pd.read_csv(io.BytesIO(data), encoding="utf-8-sig"),
+    "Parquet": lambda data: pd.read_parquet(io.BytesIO(data)),
+}
+
+
+class RecordingMediaFileManager(MediaFileManager):
+    """MediaFileManager remembering its instances, which AppTest drops after each run."""
+
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instances.append(self)
+
+
+@pytest.fixture
+def raw_data_page(monkeypatch):
+    monkeypatch.chdir(ROOT)  # the app reads data_processed/ relative to the working directory
+    with mock.patch("streamlit.testing.v1.app_test.MediaFileManager", RecordingMediaFileManager):
+        at = AppTest.from_file(os.path.join(ROOT, "JTSA_app.py"), default_timeout=120)
+        at.run()
+        at.sidebar.selectbox[0].select("Raw Data").run()
+        yield at
+
+
+@pytest.mark.parametrize("fmt", ["CSV", "Parquet"])
+def test_download_button(raw_data_page, fmt):
+    at = raw_data_page
+    next(radio for radio in at.radio if radio.label == "Download format").set_value(fmt).run()
+    at.download_button[0].click().run()
+    assert not at.exception
+
+    # The file registered by the last run, as fetched by the browser after the click
+    manager = RecordingMediaFileManager.instances[-1]
+    url = manager.execute_deferred(at.download_button[0].proto.deferred_file_id)
+    data = manager._storage.get_file(os.path.basename(url)).content
+
+    exported = READERS[fmt](data)
+    expected = pd.read_parquet(os.path.join(ROOT, "data_processed", "df_clean.parquet"))
+    assert exported.shape == expected.shape
+    assert list(exported.columns) == list(expected.columns)
+    assert exported["respondent_id"].tolist() == expected["respondent_id"].tolist()